@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "update_git_repos.py"
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+DEFAULT_SCALES = [10, 100, 1000]
+
+CURRENT = "current"
+AHEAD = "ahead"
+BEHIND = "behind"
+DIRTY = "dirty"
+
+# Template clones point here; each generated repository gets the file:// URL of its own remote
+REMOTE_PLACEHOLDER = "file:///__bench_remote__"
+
+# Wraps the real git: logs every command line to $BENCH_GIT_LOG, then runs it
+GIT_WRAPPER = """#!/bin/sh
+printf '%s\\n' "$*" >> "$BENCH_GIT_LOG"
+exec {git} "$@"
+"""
+
+GLOBAL_OPTIONS_WITH_VALUE = ("-C", "-c", "--git-dir", "--work-tree")
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost", *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+
+def commit(work, n):
+    (work / "CHANGELOG.md").write_text("".join(f"- change {i}\n" for i in range(n + 1)))
+    git("add", "-A", cwd=work)
+    git("commit", "--quiet", "-m", f"change {n}", cwd=work)
+
+
+# Two bare remotes (at the clone's commit, and two commits past it) and one clone per state.
+# Generated repositories are copies of these, so a fixture of any size takes no git commands.
+def build_templates(template_dir):
+    if (template_dir / "templates.json").exists():
+        return
+    if template_dir.exists():
+        shutil.rmtree(template_dir)
+    template_dir.mkdir(parents=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp) / "work"
+        work.mkdir()
+        git("init", "--quiet", "--initial-branch=main", cwd=work)
+        for n in range(3):
+            commit(work, n)
+        git("clone", "--quiet", "--bare", str(work), str(template_dir / "remote.git"))
+
+        clone = template_dir / CURRENT
+        git("clone", "--quiet", str(template_dir / "remote.git"), str(clone))
+        git("remote", "set-url", "origin", REMOTE_PLACEHOLDER, cwd=clone)
+
+        for n in range(3, 5):
+            commit(work, n)
+        git("clone", "--quiet", "--bare", str(work), str(template_dir / "remote_moved.git"))
+
+        # behind: the remote moved on since the clone; ahead: an unpushed local commit
+        shutil.copytree(clone, template_dir / BEHIND, symlinks=True)
+        shutil.copytree(clone, template_dir / AHEAD, symlinks=True)
+        commit(template_dir / AHEAD, 10)
+        shutil.copytree(clone, template_dir / DIRTY, symlinks=True)
+        (template_dir / DIRTY / "CHANGELOG.md").write_text("- uncommitted\n")
+
+    (template_dir / "templates.json").write_text(json.dumps({"states": [CURRENT, AHEAD, BEHIND, DIRTY]}))
+
+
+def pick_states(count, ratios, seed=1337):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(count):
+        roll = rng.random()
+        for state, ratio in ratios:
+            if roll < ratio:
+                states.append(state)
+                break
+            roll -= ratio
+        else:
+            states.append(CURRENT)
+    return states
+
+
+# N repositories under run_dir/repos, each with its own bare remote under run_dir/remotes
+def generate_repos(template_dir, run_dir, states):
+    for i, state in enumerate(states):
+        remote = run_dir / "remotes" / f"repo-{i}.git"
+        shutil.copytree(template_dir / ("remote_moved.git" if state == BEHIND else "remote.git"), remote, symlinks=True)
+        repo = run_dir / "repos" / f"repo-{i}"
+        shutil.copytree(template_dir / state, repo, symlinks=True)
+        config = repo / ".git" / "config"
+        config.write_text(config.read_text().replace(REMOTE_PLACEHOLDER, remote.resolve().as_uri()))
+
+
+def install_git_wrapper(bin_dir):
+    real_git = shutil.which("git")
+    if real_git is None:
+        sys.exit("git not found on PATH")
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    wrapper = bin_dir / "git"
+    wrapper.write_text(GIT_WRAPPER.format(git=real_git))
+    wrapper.chmod(0o755)
+
+
+def git_subcommand(command_line):
+    args = iter(command_line.split())
+    for arg in args:
+        if arg in GLOBAL_OPTIONS_WITH_VALUE:
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return "git"
+
+
+# Updated/Failed/Skipped counts from the summary panel
+def summary_counts(output):
+    return {label.lower(): int(n) for label, n in re.findall(r"(Updated|Failed|Skipped)\s+(\d+)", output)}
+
+
+def run_benchmark(template_dir, count, ratios, script_args):
+    states = pick_states(count, ratios)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        generate_repos(template_dir, tmp, states)
+        install_git_wrapper(tmp / "bin")
+        git_log = tmp / "git_commands.log"
+        git_log.touch()
+        env = {**os.environ, "HOME": str(tmp), "BENCH_GIT_LOG": str(git_log),
+               "PATH": f"{tmp / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}",
+               "GIT_CONFIG_COUNT": "1", "GIT_CONFIG_KEY_0": "protocol.file.allow", "GIT_CONFIG_VALUE_0": "always"}
+        env.pop("GIT_PYTHON_GIT_EXECUTABLE", None)
+
+        cmd = [sys.executable, str(SCRIPT), "--directory", str(tmp / "repos"), "--no-index", *script_args]
+        with open(tmp / "output.txt", "w") as output:
+            start = time.perf_counter()
+            process = subprocess.Popen(cmd, env=env, cwd=tmp, stdout=output, stderr=subprocess.STDOUT)
+            _, status, rusage = os.wait4(process.pid, 0)
+            wall = time.perf_counter() - start
+        text = (tmp / "output.txt").read_text(errors="replace")
+        if os.waitstatus_to_exitcode(status) != 0:
+            print(text)
+            sys.exit(f"update_git_repos.py exited with {os.waitstatus_to_exitcode(status)}")
+
+        commands = git_log.read_text().splitlines()
+        return {
+            "repos": count,
+            "states": dict(Counter(states)),
+            "args": script_args,
+            "wall_seconds": round(wall, 3),
+            "repos_per_second": round(count / wall, 2),
+            "git_subprocesses": len(commands),
+            "git_commands": dict(Counter(git_subcommand(c) for c in commands).most_common()),
+            # ru_maxrss is in KB on Linux: the largest of the script and the git processes it waited for
+            "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+            "outcome": summary_counts(text),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run update_git_repos.py against generated local repositories and measure it")
+    parser.add_argument("--repos", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="Repository counts to benchmark (default: 10 100 1000)")
+    parser.add_argument("--ahead-ratio", type=float, default=0.1, help="Share of repositories with an unpushed commit (default: 0.1)")
+    parser.add_argument("--behind-ratio", type=float, default=0.3, help="Share of repositories whose remote moved on (default: 0.3)")
+    parser.add_argument("--dirty-ratio", type=float, default=0.1, help="Share of repositories with uncommitted changes (default: 0.1)")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR / "templates",
+                        help="Template repository directory (default: fixtures/templates)")
+    parser.add_argument("--output", type=Path, help="Append the results as one JSON line to this file instead of printing them")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER,
+                        help="Arguments passed on to update_git_repos.py after --, e.g. -- --jobs 8")
+    args = parser.parse_args()
+    script_args = [a for a in args.script_args if a != "--"]
+    ratios = [(DIRTY, args.dirty_ratio), (BEHIND, args.behind_ratio), (AHEAD, args.ahead_ratio)]
+    if any(ratio < 0 for _, ratio in ratios) or sum(ratio for _, ratio in ratios) > 1:
+        parser.error("ratios must be non-negative and add up to at most 1")
+
+    build_templates(args.fixtures)
+    results = []
+    for count in args.repos:
+        result = run_benchmark(args.fixtures, count, ratios, script_args)
+        results.append(result)
+        print(f"{count:>6} repos  {result['wall_seconds']:>8.2f}s  {result['repos_per_second']:>8.2f} repos/s  "
+              f"{result['git_subprocesses']:>6} git calls  peak RSS {result['peak_rss_mb']:.1f} MB  {result['outcome']}",
+              file=sys.stderr)
+
+    record = {"timestamp": datetime.now().isoformat(timespec="seconds"), "script_args": script_args,
+              "ratios": dict(ratios), "results": results}
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    else:
+        print(json.dumps(record, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,16 @@ from pathlib import Path
 import logging
 from datetime import datetime
 import sys
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from fnmatch import fnmatch
+from urllib.parse import urlsplit
 from rich.console import Console
 from rich.logging import RichHandler
 from rich.progress import Progress, SpinnerColumn, TextColumn
@@ -23,6 +32,21 @@ custom_theme = Theme({
 
 console = Console(theme=custom_theme)
 
+UPDATED = "updated"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+DEFAULT_INDEX_FILE = Path.home() / '.cache' / 'update_git_repos' / 'index.json'
+
+# ls-remote calls running at once against one host; SSH connections are shared through ControlMaster
+HOST_CONCURRENCY = 8
+# How long an idle shared SSH connection stays open
+SSH_CONTROL_PERSIST = 60
+
+# Working tree state from `git status --porcelain=v2 --branch`. branch is None on a detached
+# HEAD, upstream is None without a tracking branch, and then ahead and behind are None too.
+RepoStatus = namedtuple('RepoStatus', ['branch', 'upstream', 'ahead', 'behind', 'dirty'])
+
 def setup_logging():
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     log_file = Path.home() / f'git_update_{timestamp}.log'
@@ -37,45 +61,277 @@ def setup_logging():
     )
     return log_file
 
-def update_repository(repo_path, progress, aggressive=False):
+def is_excluded(relative_path, exclude):
+    return any(fnmatch(relative_path, pat) for pat in exclude)
+
+# A path no real directory has: a pattern that matches <dir>/PRUNE_PROBE matches any
+# path under <dir> (grp/*, */node_modules*), so the walk can skip <dir> entirely
+PRUNE_PROBE = '\0/\0\0'
+
+def covers_descendants(relative_path, exclude):
+    return is_excluded(f"{relative_path}/{PRUNE_PROBE}", exclude)
+
+# Directory entries discovery needs, keyed by path relative to the root: whether the directory
+# is a repository and its subdirectories, valid for as long as its mtime stays the same. A
+# directory's mtime changes whenever an entry is added, removed or renamed in it, which covers
+# new repositories (git init / clone creating .git), deleted ones and new subdirectories.
+class RepoIndex:
+    def __init__(self, index_file, root_path):
+        self.index_file = Path(index_file)
+        self.root = str(Path(root_path).resolve())
+        self.dirs = {}
+        self.hits = self.misses = 0
+        try:
+            with open(self.index_file) as f:
+                self.dirs = json.load(f).get(self.root, {})
+        except (OSError, ValueError):
+            self.dirs = {}
+
+    def get(self, relative_path, mtime_ns):
+        entry = self.dirs.get(relative_path)
+        if entry is not None and entry['mtime'] == mtime_ns:
+            self.hits += 1
+            return entry['repo'], entry['subdirs']
+        self.misses += 1
+        return None
+
+    def put(self, relative_path, mtime_ns, is_repo, subdirs):
+        self.dirs[relative_path] = {'mtime': mtime_ns, 'repo': is_repo, 'subdirs': subdirs}
+
+    # Keep only the directories seen in this walk, alongside the indexes of other roots
+    def save(self, seen):
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[self.root] = {path: entry for path, entry in self.dirs.items() if path in seen}
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.index_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.index_file)
+
+def scan_directory(path):
+    is_repo = False
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name == '.git':
+                # A directory for a normal clone, a file for worktrees and submodules
+                is_repo = True
+            elif entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+    return is_repo, sorted(subdirs)
+
+# Find the repositories under root_path with os.scandir: stop descending at the first .git
+# (nested working trees, node_modules and build output inside a repository are never
+# entered). An excluded directory is only pruned when the exclude pattern covers everything
+# under it too, so -e grp still finds grp/b while -e 'grp/*' skips the whole tree. Without
+# recursive only root_path itself is checked. With an index, directories whose mtime is
+# unchanged are not listed again. Returns (repositories, excluded repositories), both as paths.
+def discover_repositories(root_path, recursive=True, exclude=(), index=None):
+    root_path = Path(root_path)
+    repos, excluded, seen = [], [], set()
+    stack = ['']
+    while stack:
+        relative_path = stack.pop()
+        path = root_path / relative_path
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+            cached = index.get(relative_path, mtime_ns) if index is not None else None
+            is_repo, subdirs = cached if cached is not None else scan_directory(path)
+        except OSError:
+            continue
+        if index is not None:
+            seen.add(relative_path)
+            if cached is None:
+                index.put(relative_path, mtime_ns, is_repo, subdirs)
+
+        if is_repo:
+            (excluded if relative_path and is_excluded(relative_path, exclude) else repos).append(path)
+            continue
+        if not recursive:
+            break
+        for name in reversed(subdirs):
+            child = f"{relative_path}/{name}" if relative_path else name
+            if not (is_excluded(child, exclude) and covers_descendants(child, exclude)):
+                stack.append(child)
+            elif (root_path / child / '.git').exists():
+                excluded.append(root_path / child)
+
+    if index is not None:
+        index.save(seen)
+    return repos, excluded
+
+def parse_status(output):
+    branch = upstream = ahead = behind = None
+    dirty = False
+    for line in output.splitlines():
+        if line.startswith('# branch.head '):
+            head = line[len('# branch.head '):]
+            branch = None if head == '(detached)' else head
+        elif line.startswith('# branch.upstream '):
+            upstream = line[len('# branch.upstream '):]
+        elif line.startswith('# branch.ab '):
+            plus, minus = line[len('# branch.ab '):].split()
+            ahead, behind = int(plus), -int(minus)
+        elif line and not line.startswith(('#', '?', '!')):
+            # '1', '2' and 'u' entries are changed, renamed and unmerged tracked files
+            dirty = True
+    return RepoStatus(branch, upstream, ahead, behind, dirty)
+
+# Dirty state, branch, upstream and ahead/behind counts from a single git call. Untracked
+# files are left out, as repo.is_dirty() did, which also spares git walking them.
+def repo_status(repo):
+    return parse_status(repo.git.status('--porcelain=v2', '--branch', '--untracked-files=no'))
+
+# Host of a remote URL: https://host/..., ssh://user@host/... or scp-like user@host:path.
+# Local paths and file:// URLs have no host.
+def remote_host(url):
+    if '://' in url:
+        return urlsplit(url).hostname or 'local'
+    first = url.split('/', 1)[0]
+    if ':' in first:
+        return first.split(':', 1)[0].split('@')[-1]
+    return 'local'
+
+# Does the user pick the SSH command themselves? GIT_SSH_COMMAND would override it
+def custom_ssh_configured():
+    if any(os.environ.get(name) for name in ('GIT_SSH_COMMAND', 'GIT_SSH', 'GIT_SSH_VARIANT')):
+        return True
+    try:
+        return bool(git.Git().config('--get', 'core.sshCommand'))
+    except git.exc.GitCommandError:
+        # Exit code 1: not set
+        return False
+
+# One SSH master connection per host for the whole run: every ls-remote, fetch and pull to
+# a host after the first skips the SSH handshake. Returns the control directory to remove
+# at the end, or None when the user configured their own SSH command (GIT_SSH_COMMAND,
+# GIT_SSH, GIT_SSH_VARIANT or core.sshCommand), which is left alone.
+def enable_ssh_multiplexing():
+    if custom_ssh_configured():
+        logging.info("Custom SSH command configured, not multiplexing SSH connections")
+        return None
+    # Socket paths are limited to ~100 characters, so keep the directory short
+    control_dir = tempfile.mkdtemp(prefix='ugr-', dir='/tmp' if os.path.isdir('/tmp') else None)
+    os.environ['GIT_SSH_COMMAND'] = (f"ssh -o ControlMaster=auto -o ControlPath={control_dir}/%C "
+                                     f"-o ControlPersist={SSH_CONTROL_PERSIST}")
+    return control_dir
+
+# Has the remote branch moved since the last fetch? Compares `git ls-remote` for the current
+# branch with the local tracking ref, read from the ref files. Returns None when it can't
+# tell (detached HEAD, no tracking ref yet, ls-remote failed), which means fetch as usual.
+def remote_changed(repo_path):
+    try:
+        repo = git.Repo(repo_path)
+        branch = repo.head.reference.name
+        local_sha = git.SymbolicReference.dereference_recursive(repo, f'refs/remotes/origin/{branch}')
+        output = repo.git.ls_remote('origin', f'refs/heads/{branch}')
+    except (TypeError, ValueError, git.exc.GitError):
+        return None
+    remote_sha = output.split('\t', 1)[0] if output else None
+    return remote_sha != local_sha
+
+# Check every repository's remote before updating, grouped by host so no host gets more than
+# HOST_CONCURRENCY ls-remote calls at a time. Returns the repository paths whose remote is unchanged.
+def plan_fetches(repo_paths, jobs, progress):
+    by_host = {}
+    for repo_path in repo_paths:
+        try:
+            url = git.Repo(repo_path).remotes.origin.url
+        except (AttributeError, IndexError, ValueError, git.exc.GitError):
+            continue
+        by_host.setdefault(remote_host(url), []).append(repo_path)
+
+    limits = {host: threading.Semaphore(HOST_CONCURRENCY) for host in by_host}
+    def check(host, repo_path):
+        with limits[host]:
+            return remote_changed(repo_path)
+
+    task = progress.add_task(f"[cyan]Checking remotes on {len(by_host)} hosts", total=None, repo="")
+    unchanged = set()
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="plan") as executor:
+        futures = {executor.submit(check, host, repo_path): repo_path
+                   for host, paths in by_host.items() for repo_path in paths}
+        for future in as_completed(futures):
+            if future.result() is False:
+                unchanged.add(futures[future])
+            progress.update(task, repo=str(futures[future].name))
+    progress.remove_task(task)
+    return unchanged
+
+# Returns UPDATED, FAILED or SKIPPED (uncommitted changes). Messages name the repository,
+# since with --jobs they interleave with those of the other workers.
+# remote_unchanged=True (from plan_fetches) skips the fetch.
+def update_repository(repo_path, progress, aggressive=False, remote_unchanged=False):
     try:
         repo = git.Repo(repo_path)
 
-        if repo.is_dirty():
+        status = repo_status(repo)
+        if status.dirty:
             progress.print(f"[yellow]⚠️  Uncommitted changes in {repo_path}, skipping...[/]")
-            return False
+            return SKIPPED
+        if status.branch is None:
+            progress.print(f"[red]❌ {repo_path} has a detached HEAD, no branch to update[/]")
+            return FAILED
 
-        default_branch = repo.active_branch
+        default_branch = status.branch
         origin = repo.remotes.origin
 
-        progress.print(f"[blue]📡 Fetching updates for {repo_path}[/]")
-        origin.fetch()
+        if not remote_unchanged:
+            progress.print(f"[blue]📡 Fetching updates for {repo_path}[/]")
+            origin.fetch()
 
-        commits_behind = list(repo.iter_commits(f'{default_branch}..origin/{default_branch}'))
+        # The fetch moved the tracking branch; count from git instead of walking commit objects.
+        # Without a fetch the tracking branch is current and the status already has the count.
+        if status.upstream is not None:
+            commits_behind = (status if remote_unchanged else repo_status(repo)).behind or 0
+        else:
+            commits_behind = int(repo.git.rev_list('--count', f'{default_branch}..origin/{default_branch}'))
         if commits_behind:
-            progress.print(f"[yellow]⏳ Repository is behind by {len(commits_behind)} commits[/]")
+            progress.print(f"[yellow]⏳ {repo_path} is behind by {commits_behind} commits[/]")
 
             if aggressive:
-                progress.print("[yellow]🔄 Using aggressive mode (reset + rebase)[/]")
+                progress.print(f"[yellow]🔄 Using aggressive mode (reset + rebase) for {repo_path}[/]")
                 repo.git.reset('--hard', f'origin/{default_branch}')
                 repo.git.pull('--rebase')
             else:
-                progress.print("[green]🛡️  Using safe mode (simple pull)[/]")
+                progress.print(f"[green]🛡️  Using safe mode (simple pull) for {repo_path}[/]")
                 origin.pull()
 
             progress.print(f"[green]✅ Successfully updated {repo_path}[/]")
         else:
-            progress.print(f"[green]✨ Repository is up to date[/]")
+            progress.print(f"[green]✨ {repo_path} is up to date[/]")
 
-        return True
+        return UPDATED
     except git.exc.InvalidGitRepositoryError:
         progress.print(f"[red]❌ {repo_path} is not a valid git repository[/]")
-        return False
+        return FAILED
     except Exception as e:
         progress.print(f"[red]❌ Error processing {repo_path}: {str(e)}[/]")
-        return False
-
-class RichGroup(click.Group):
+        return FAILED
+
+# One progress line per worker showing the repository it is on. A worker takes a free line
+# for each repository and hands it back when done, so the lines match the active workers.
+class WorkerLines:
+    def __init__(self, progress, jobs):
+        self.progress = progress
+        self.free = queue.Queue()
+        for n in range(jobs):
+            self.free.put(progress.add_task(f"[cyan]Worker {n + 1}", total=None, repo="idle"))
+
+    def run(self, repo_path, relative_path, aggressive, remote_unchanged=False):
+        task = self.free.get()
+        self.progress.update(task, repo=str(relative_path))
+        try:
+            return update_repository(repo_path, self.progress, aggressive, remote_unchanged)
+        finally:
+            self.progress.update(task, repo="idle")
+            self.free.put(task)
+
+class RichGroup(click.Command):
     def format_help(self, ctx, formatter):
         console.print(Panel.fit(
             "[bold blue]Git Repository Update Tool[/]\n",
@@ -97,6 +353,10 @@ class RichGroup(click.Group):
         table.add_row("-v, --verbose", "Increase output verbosity", "False")
         table.add_row("-e, --exclude", "Exclude patterns (e.g., 'temp-*')", "None")
         table.add_row("--aggressive/--safe", "Use aggressive (reset+rebase) or safe (pull) update", "safe")
+        table.add_row("-j, --jobs", "Repositories fetched and pulled in parallel", "1")
+        table.add_row("--plan/--no-plan", "Only fetch repositories whose remote branch moved (git ls-remote)", "plan")
+        table.add_row("--ssh-multiplex/--no-ssh-multiplex", "Share one SSH connection per host", "no-ssh-multiplex")
+        table.add_row("--index/--no-index", "Reuse the directory listings of unchanged directories", "no-index")
 
         console.print(table)
 
@@ -114,6 +374,9 @@ class RichGroup(click.Group):
                 "",
                 "[cyan]# Exclude patterns with aggressive update[/]",
                 "[green]$ update_repos.py -e 'temp-*' --aggressive[/]",
+                "",
+                "[cyan]# Update 16 repositories at a time[/]",
+                "[green]$ update_repos.py --jobs 16[/]",
             ]),
             title="Usage Examples",
             border_style="blue"
@@ -137,7 +400,25 @@ class RichGroup(click.Group):
 @click.option('--aggressive/--safe',
               default=False,
               help='Aggressive mode uses reset --hard and rebase, safe mode uses simple pull')
-def update_repos(directory, recursive, verbose, exclude, aggressive):
+@click.option('--jobs', '-j',
+              type=click.IntRange(min=1),
+              default=1,
+              help='Number of repositories fetched and pulled in parallel')
+@click.option('--index/--no-index',
+              default=False,
+              help='Cache directory listings between runs and only list directories whose mtime changed')
+@click.option('--index-file',
+              type=click.Path(dir_okay=False),
+              default=str(DEFAULT_INDEX_FILE),
+              help='Where the --index cache is kept')
+@click.option('--plan/--no-plan',
+              default=True,
+              help='Check remotes with git ls-remote first and only fetch repositories whose branch moved')
+@click.option('--ssh-multiplex/--no-ssh-multiplex',
+              default=False,
+              help='Share one SSH connection per host (ControlMaster), unless an SSH command is configured '
+                   '(GIT_SSH_COMMAND, GIT_SSH, GIT_SSH_VARIANT or core.sshCommand)')
+def update_repos(directory, recursive, verbose, exclude, aggressive, jobs, index, index_file, plan, ssh_multiplex):
     """🔄 Update all git repositories in the specified directory.
 
     Update Modes:
@@ -157,13 +438,18 @@ def update_repos(directory, recursive, verbose, exclude, aggressive):
         f"[bold blue]Git Repository Update Tool[/]\n"
         f"[cyan]Directory:[/] {root_path}\n"
         f"[cyan]Recursive:[/] {'Yes' if recursive else 'No'}\n"
-        f"[cyan]Exclude patterns:[/] {', '.join(exclude) if exclude else 'None'}"
+        f"[cyan]Exclude patterns:[/] {', '.join(exclude) if exclude else 'None'}\n"
+        f"[cyan]Jobs:[/] {jobs} ({'aggressive' if aggressive else 'safe'} mode)"
     ))
 
-    pattern = '**/.git' if recursive else '.git'
-    git_dirs = list(root_path.glob(pattern))
+    repo_index = RepoIndex(index_file, root_path) if index else None
+    repo_paths, excluded_paths = discover_repositories(root_path, recursive, exclude, repo_index)
+    total = len(repo_paths) + len(excluded_paths)
+    if repo_index is not None:
+        logging.info(f"Discovery index: {repo_index.hits} directories unchanged, {repo_index.misses} listed")
 
-    updated = failed = skipped = 0
+    counts = {UPDATED: 0, FAILED: 0, SKIPPED: 0}
+    control_dir = enable_ssh_multiplexing() if ssh_multiplex else None
 
     with Progress(
         "[progress.description]{task.description}",
@@ -172,33 +458,40 @@ def update_repos(directory, recursive, verbose, exclude, aggressive):
         console=console
     ) as progress:
         total_task = progress.add_task(
-            "[cyan]Scanning repositories...",
-            total=len(git_dirs)
+            f"[cyan]Updating repositories 0/{total}",
+            total=total,
+            repo=""
         )
-
-        for git_dir in git_dirs:
-            repo_path = git_dir.parent
-            relative_path = repo_path.relative_to(root_path)
-
-            progress.update(
-                total_task,
-                advance=1,
-                repo=str(relative_path)
-            )
-
-            if any(fnmatch(str(relative_path), pat) for pat in exclude):
-                console.print(f"[yellow]⏭️  Skipping:[/] {repo_path}")
-                skipped += 1
-                continue
-
-            with console.status(
-                f"[blue]📂 Processing {repo_path}[/] ({'aggressive' if aggressive else 'safe'} mode)",
-                spinner="dots"
-            ):
-                if update_repository(repo_path, console, aggressive):
-                    updated += 1
-                else:
-                    failed += 1
+        unchanged = plan_fetches(repo_paths, jobs, progress) if plan else set()
+        if plan:
+            progress.print(f"[blue]📋 {len(unchanged)} of {len(repo_paths)} remotes unchanged, fetching the rest[/]")
+        workers = WorkerLines(progress, jobs)
+
+        # Fetches and pulls are network and git subprocess waits, so threads overlap them well
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="update") as executor:
+            for repo_path in excluded_paths:
+                progress.print(f"[yellow]⏭️  Skipping:[/] {repo_path}")
+                counts[SKIPPED] += 1
+
+            futures = {}
+            for repo_path in repo_paths:
+                relative_path = repo_path.relative_to(root_path)
+                futures[executor.submit(workers.run, repo_path, relative_path, aggressive,
+                                        repo_path in unchanged)] = relative_path
+
+            # Results are counted here, on the main thread, as each repository finishes
+            progress.update(total_task, advance=counts[SKIPPED],
+                            description=f"[cyan]Updating repositories {counts[SKIPPED]}/{total}")
+            for future in as_completed(futures):
+                counts[future.result()] += 1
+                done = sum(counts.values())
+                progress.update(total_task, advance=1, repo=str(futures[future]),
+                                description=f"[cyan]Updating repositories {done}/{total}")
+
+    if control_dir is not None:
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+    updated, failed, skipped = counts[UPDATED], counts[FAILED], counts[SKIPPED]
 
     summary = Table.grid(padding=1)
     summary.add_row("[bold green]✅ Updated[/]", f"[green]{updated}[/]")
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import instrumentation
+import repo_scanner
+from clone_pool import GIT_ENV
+
+logger = logging.getLogger(__name__)
+
+WORKFLOWS_DIR = ".github/workflows"
+
+# Blobs not seen in a scan for this long are dropped from the cache
+BLOB_CACHE_MAX_AGE = 30 * 24 * 3600
+
+
+# (path, blob sha) of every file under .github/workflows/ at rev, read from the tree objects
+# alone, so no blob has to be downloaded or checked out to list them
+def list_workflows(git_dir, rev="HEAD"):
+    result = instrumentation.run(["git", "--git-dir", str(git_dir), "ls-tree", "-r", "-z", rev, "--", f"{WORKFLOWS_DIR}/"],
+                                 capture_output=True, env=GIT_ENV)
+    if result.returncode != 0:
+        logger.warning(f"git ls-tree failed in {git_dir}: {result.stderr.decode(errors='replace').strip()}")
+        return []
+    workflows = []
+    for entry in result.stdout.split(b"\0"):
+        if not entry:
+            continue
+        info, path = entry.split(b"\t", 1)
+        _, object_type, sha = info.split()
+        if object_type == b"blob":
+            workflows.append((path.decode(errors="replace"), sha.decode()))
+    return workflows
+
+
+# One long-running `git cat-file --batch` per mirror: every blob is a write and a read on the
+# same process instead of a git subprocess per file. In a blobless mirror git fetches a
+# missing blob from the promisor remote on demand.
+class CatFileBatch:
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.process = subprocess.Popen(["git", "--git-dir", str(git_dir), "cat-file", "--batch"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, env=GIT_ENV)
+
+    # Contents of the object sha as bytes, or None when it is missing
+    @instrumentation.timed("cat_file_read")
+    def read(self, sha):
+        self.process.stdin.write(f"{sha}\n".encode())
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            logger.warning(f"Object {sha} missing from {self.git_dir}")
+            return None
+        size = int(header[2])
+        data = self.process.stdout.read(size)
+        # Every object is followed by a newline
+        self.process.stdout.read(1)
+        return data
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Scan results keyed by blob sha. A blob's contents never change, so a workflow file that is
+# unchanged since the last run, or shared with a fork or template, is only ever scanned once.
+class BlobScanCache:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.patterns = []
+        self.blobs = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                self.patterns = data.get("patterns", [])
+                self.blobs = data.get("blobs", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable blob scan cache {self.path}: {e}")
+
+    # Cached results are only valid for the patterns they were scanned with
+    def use_patterns(self, patterns):
+        patterns = sorted(patterns)
+        if patterns != self.patterns:
+            self.patterns = patterns
+            self.blobs = {}
+
+    def clear(self):
+        with self._lock:
+            self.blobs = {}
+
+    def get(self, sha):
+        with self._lock:
+            entry = self.blobs.get(sha)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["seen"] = time.time()
+            return entry["matches"]
+
+    def put(self, sha, matches):
+        with self._lock:
+            self.blobs[sha] = {"seen": time.time(), "matches": matches}
+
+    @instrumentation.timed("file_write", target="workflow_blob_cache")
+    def save(self):
+        cutoff = time.time() - BLOB_CACHE_MAX_AGE
+        blobs = {sha: entry for sha, entry in self.blobs.items() if entry["seen"] >= cutoff}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"patterns": self.patterns, "blobs": blobs}, f)
+        os.replace(tmp_path, self.path)
+
+
+# Scan the workflow files at HEAD of one bare mirror, reading only the blobs the cache has not seen.
+# analyze, when given, replaces the pattern search: it takes a blob's bytes and returns
+# (line, pattern, text) tuples, like workflow_analyzer.analyze_workflow.
+def scan_mirror(git_dir, patterns, cache, analyze=None):
+    regex, lookup = repo_scanner.compile_patterns(tuple(sorted(patterns)))
+    matches = []
+    reader = None
+    try:
+        for path, sha in list_workflows(git_dir):
+            blob_matches = cache.get(sha)
+            if blob_matches is None:
+                if reader is None:
+                    reader = CatFileBatch(git_dir)
+                data = reader.read(sha)
+                if data is None:
+                    continue
+                if repo_scanner.is_binary(data):
+                    blob_matches = []
+                elif analyze is not None:
+                    blob_matches = analyze(data)
+                else:
+                    blob_matches = repo_scanner.scan_buffer(data, regex, lookup)
+                cache.put(sha, blob_matches)
+            matches.extend(repo_scanner.Match(str(git_dir), path, *match) for match in blob_matches)
+    finally:
+        if reader is not None:
+            reader.close()
+    return matches
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from http_cassette import CASSETTE_ENV, MODE_ENV, LATENCY_ENV, REPLAY, request_key  # noqa: E402
+from huntr_listing import HUNTR_BOUNTIES_URL, page_url  # noqa: E402
+
+RECON_DIR = Path(__file__).resolve().parent.parent
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+SCRIPTS = {
+    "huntr-scraper": RECON_DIR / "huntr-scraper.py",
+    "workflow": RECON_DIR / "huntr_workflow_dispatch_scraper.py",
+}
+GITHUB_API = "https://api.github.com/repos"
+CARDS_PER_PAGE = 50
+
+CARD = ('<div class="group flex flex-row"><img alt="Repo" src="https://huntr.com/_next/image?url=%2Forgs%2F{org}.png&amp;w=64">'
+        '<div class="flex flex-col"><span>{repo}</span></div></div>')
+
+WORKFLOW_PR_TARGET = """name: label
+on:
+  pull_request_target:
+    types: [opened]
+jobs:
+  label:
+    runs-on: ubuntu-latest
+    steps:
+      - uses: actions/labeler@v5
+"""
+
+WORKFLOW_PUSH = """name: ci
+on: [push, pull_request]
+jobs:
+  test:
+    runs-on: ubuntu-latest
+    steps:
+      - uses: actions/checkout@v4
+      - run: make test
+"""
+
+
+def fixture_repos(count, seed=1337):
+    rng = random.Random(seed)
+    return [(f"org{rng.randrange(count // 10 + 1)}", f"repo-{i}") for i in range(count)]
+
+
+def cassette_line(method, url, body, status=200, content_type="application/json"):
+    response = {"status": status, "reason": "OK", "headers": {"Content-Type": content_type}, "body": body}
+    return json.dumps({"key": request_key(method, url), "response": response}, separators=(",", ":"))
+
+
+# Listing pages and GitHub REST responses for every repository, as an http_cassette file
+def write_cassette(path, repos, seed=1337):
+    rng = random.Random(seed)
+    languages = ["Python", "Go", "TypeScript", "Rust", "C++", "Java"]
+    with open(path, "w") as f:
+        pages = [repos[i:i + CARDS_PER_PAGE] for i in range(0, len(repos), CARDS_PER_PAGE)]
+        for page, page_repos in enumerate(pages, 1):
+            html = "<html><body><main>" + "".join(CARD.format(org=o, repo=r) for o, r in page_repos) + "</main></body></html>"
+            f.write(cassette_line("GET", page_url(HUNTR_BOUNTIES_URL, page), html, content_type="text/html") + "\n")
+        for org, repo in repos:
+            url = f"{GITHUB_API}/{org}/{repo}"
+            repo_data = {"full_name": f"{org}/{repo}", "owner": {"login": org, "type": "Organization"},
+                         "organization": {"login": org}, "size": rng.randrange(10, 5000)}
+            f.write(cassette_line("GET", url, json.dumps(repo_data)) + "\n")
+            repo_languages = {language: rng.randrange(1000, 100000) for language in rng.sample(languages, 2)}
+            f.write(cassette_line("GET", f"{url}/languages", json.dumps(repo_languages)) + "\n")
+            f.write(cassette_line("GET", f"{url}/automated-security-fixes",
+                                  json.dumps({"enabled": rng.random() < 0.5, "paused": False})) + "\n")
+    return len(pages)
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+# Local bare repositories standing in for github.com: two templates, copied per repository
+def write_git_fixtures(git_dir, repos, pr_target_ratio, seed=1337):
+    rng = random.Random(seed)
+    templates = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, workflow in [("pr_target", WORKFLOW_PR_TARGET), ("push", WORKFLOW_PUSH)]:
+            work = Path(tmp) / name
+            (work / ".github" / "workflows").mkdir(parents=True)
+            (work / ".github" / "workflows" / f"{name}.yml").write_text(workflow)
+            (work / "README.md").write_text(f"# {name}\n")
+            git("init", "--quiet", "--initial-branch=main", cwd=work)
+            git("add", "-A", cwd=work)
+            git("-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "--quiet", "-m", "init", cwd=work)
+            templates[name] = Path(tmp) / f"{name}.git"
+            git("clone", "--quiet", "--bare", str(work), str(templates[name]))
+            git("config", "uploadpack.allowFilter", "true", cwd=templates[name])
+            git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=templates[name])
+
+        for org, repo in repos:
+            template = templates["pr_target" if rng.random() < pr_target_ratio else "push"]
+            shutil.copytree(template, git_dir / org / f"{repo}.git")
+
+
+def build_fixtures(fixture_dir, count, pr_target_ratio):
+    repos = fixture_repos(count)
+    if (fixture_dir / "fixture.json").exists():
+        return json.loads((fixture_dir / "fixture.json").read_text())
+    if fixture_dir.exists():
+        shutil.rmtree(fixture_dir)
+    fixture_dir.mkdir(parents=True)
+    pages = write_cassette(fixture_dir / "cassette.jsonl", repos)
+    write_git_fixtures(fixture_dir / "git", repos, pr_target_ratio)
+    info = {"repos": count, "unique_repos": len(set(repos)), "pages": pages, "pr_target_ratio": pr_target_ratio}
+    (fixture_dir / "fixture.json").write_text(json.dumps(info))
+    return info
+
+
+# Environment that replays the cassette and points https://github.com/ at the local bare repositories
+def replay_env(home, cassette, git_dir, latency_ms):
+    env = {**os.environ, "HOME": str(home), "GITHUB_TOKEN": "benchmark",
+           CASSETTE_ENV: str(cassette), MODE_ENV: REPLAY, LATENCY_ENV: str(latency_ms)}
+    config = [(f"url.{git_dir.resolve().as_uri()}/.insteadOf", "https://github.com/"),
+              ("protocol.file.allow", "always")]
+    env["GIT_CONFIG_COUNT"] = str(len(config))
+    for i, (key, value) in enumerate(config):
+        env[f"GIT_CONFIG_KEY_{i}"] = key
+        env[f"GIT_CONFIG_VALUE_{i}"] = value
+    return env
+
+
+# Per-stage statistics the pipeline logs at the end of a run
+def stage_stats(home):
+    stages = []
+    for log_file in sorted((home / "git" / "bounties" / "logs").glob("*.jsonl")):
+        with open(log_file) as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["msg"].startswith("Pipeline stage") and "payload" in entry:
+                    stages.append(entry["payload"])
+    return stages
+
+
+def run_script(name, script_args, fixture_dir, info, latency_ms):
+    with tempfile.TemporaryDirectory() as home:
+        home = Path(home)
+        env = replay_env(home, fixture_dir / "cassette.jsonl", fixture_dir / "git", latency_ms)
+        cmd = [sys.executable, str(SCRIPTS[name]), "--pages", str(info["pages"]), "--log-level", "INFO", *script_args]
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, env=env, cwd=RECON_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        if os.waitstatus_to_exitcode(status) != 0:
+            print(stderr)
+            sys.exit(f"{name} exited with {os.waitstatus_to_exitcode(status)}")
+
+        return {
+            "script": name,
+            "args": script_args,
+            "repos": info["unique_repos"],
+            "wall_seconds": round(wall, 3),
+            "repos_per_second": round(info["unique_repos"] / wall, 2),
+            # ru_maxrss is in KB on Linux: the largest of the script and the git processes it waited for
+            "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+            "stages": stage_stats(home),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a huntr scraper run offline and measure its throughput")
+    parser.add_argument("--repos", type=int, default=500, help="Repositories in the generated fixture (default: 500)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latency injected before every HTTP request (default: 50)")
+    parser.add_argument("--pr-target-ratio", type=float, default=0.2,
+                        help="Share of fixture repositories with a pull_request_target workflow (default: 0.2)")
+    parser.add_argument("--script", choices=[*SCRIPTS, "all"], default="all", help="Script to run (default: all)")
+    parser.add_argument("--fixtures", type=Path, help="Fixture directory (default: fixtures/pipeline_<repos>)")
+    parser.add_argument("--output", type=Path, help="Append the results as one JSON line to this file")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER,
+                        help="Arguments passed on to the script after --, e.g. -- --concurrency 16")
+    args = parser.parse_args()
+    script_args = [a for a in args.script_args if a != "--"]
+
+    fixture_dir = args.fixtures or FIXTURES_DIR / f"pipeline_{args.repos}"
+    start = time.perf_counter()
+    info = build_fixtures(fixture_dir, args.repos, args.pr_target_ratio)
+    print(f"Fixture: {fixture_dir} ({info['unique_repos']} repos, {info['pages']} pages, "
+          f"ready in {time.perf_counter() - start:.1f}s)")
+
+    results = []
+    for name in (SCRIPTS if args.script == "all" else [args.script]):
+        result = run_script(name, script_args, fixture_dir, info, args.latency_ms)
+        results.append(result)
+        print(f"{name:<16} {result['wall_seconds']:>8.2f}s  {result['repos_per_second']:>8.2f} repos/s  "
+              f"peak RSS {result['peak_rss_mb']:.1f} MB")
+        for stage in result["stages"]:
+            print(f"  {stage['stage']:<10} workers {stage['workers']:>3}  in {stage['items_in']:>5}  "
+                  f"out {stage['items_out']:>5}  busy {stage['busy_seconds']:>8.2f}s  wall {stage['wall_seconds']:>7.2f}s")
+
+    if args.output:
+        record = {"timestamp": datetime.now().isoformat(timespec="seconds"), "fixture": str(fixture_dir),
+                  "latency_ms": args.latency_ms, "fixture_info": info, "results": results}
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
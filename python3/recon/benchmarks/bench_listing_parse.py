@@ -0,0 +1,109 @@
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from huntr_listing import BOUNTY_CARD_CLASS, parse_bounty_card, parse_bounty_cards  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+DEFAULT_FIXTURE = FIXTURES_DIR / "huntr_bounties_large.html"
+
+# Markup around each card, roughly the shape of the real listing: navigation, badges and
+# nested layout divs that the old full-tree parse had to materialize too
+NOISE = """
+<div class="flex flex-col gap-2"><div class="text-sm text-gray-400"><a href="/bounties/{i}">Details</a>
+<svg viewBox="0 0 24 24"><path d="M12 2L2 7l10 5 10-5-10-5z"></path></svg>
+<ul class="flex gap-1"><li class="badge">maintained</li><li class="badge">$1,500</li><li class="badge">{lang}</li></ul>
+<p class="line-clamp-2">Model file formats, inference servers and MLOps tooling in scope for {org}/{repo}.</p></div></div>
+"""
+
+CARD = """
+<div class="group flex flex-row"><img alt="Repo" src="https://huntr.com/_next/image?url=%2Forgs%2F{org}.png&amp;w=64">
+<div class="flex flex-col"><span>{repo}</span><small class="text-xs">{org}</small></div></div>
+"""
+
+
+# Deterministic synthetic listing with the given number of bounty cards
+def generate_fixture(cards, seed=1337):
+    rng = random.Random(seed)
+    languages = ["Python", "Go", "TypeScript", "Rust", "C++", "Java"]
+    parts = ["<!DOCTYPE html><html><head><title>Bounties | huntr</title></head><body><main>"]
+    for i in range(cards):
+        org = f"org{rng.randrange(cards // 3 + 1)}"
+        repo = f"repo-{i}"
+        parts.append(NOISE.format(i=i, org=org, repo=repo, lang=rng.choice(languages)))
+        parts.append(CARD.format(org=org, repo=repo))
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+
+# What the scrapers did before huntr_listing: build the full html.parser tree, then search it
+def parse_full_tree(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return [card for card in map(parse_bounty_card, soup.find_all("div", class_=BOUNTY_CARD_CLASS)) if card]
+
+
+def time_parser(fn, html, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(html)
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing of the huntr bounties listing")
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE,
+                        help="Saved listing HTML; generated with --cards cards when missing")
+    parser.add_argument("--cards", type=int, default=5000, help="Cards in a generated fixture (default: 5000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per parser (default: 5)")
+    parser.add_argument("--output", type=Path, help="Append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    if not args.fixture.exists():
+        args.fixture.parent.mkdir(parents=True, exist_ok=True)
+        args.fixture.write_text(generate_fixture(args.cards))
+        print(f"Generated fixture with {args.cards} cards: {args.fixture}")
+
+    html = args.fixture.read_bytes()
+    candidates = {"full_tree_html.parser": parse_full_tree,
+                  "strainer_html.parser": lambda h: parse_bounty_cards(h, parser="html.parser")}
+    try:
+        import lxml  # noqa: F401
+        candidates["strainer_lxml"] = lambda h: parse_bounty_cards(h, parser="lxml")
+    except ImportError:
+        print("lxml not installed, skipping the lxml parser")
+
+    results = {}
+    baseline = None
+    for name, fn in candidates.items():
+        repos, timings = time_parser(fn, html, args.repeat)
+        if baseline is None:
+            baseline = repos
+        elif repos != baseline:
+            print(f"{name} parsed {len(repos)} repos, expected {len(baseline)}")
+            sys.exit(1)
+        results[name] = {"median_seconds": round(statistics.median(timings), 4),
+                         "min_seconds": round(min(timings), 4),
+                         "repos": len(repos)}
+        print(f"{name:<24} median {results[name]['median_seconds']:.4f}s  "
+              f"min {results[name]['min_seconds']:.4f}s  repos {len(repos)}")
+
+    if args.output:
+        record = {"timestamp": datetime.now().isoformat(timespec="seconds"), "fixture": str(args.fixture),
+                  "fixture_bytes": len(html), "repeat": args.repeat, "results": results}
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import logging
+import math
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from subprocess import TimeoutExpired
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+CLONED = "cloned"
+EXISTS = "exists"
+UPDATED = "updated"
+TIMEOUT = "timeout"
+FAILED = "failed"
+
+CloneResult = namedtuple("CloneResult", ["org", "repo", "path", "status", "timeout", "elapsed", "error"])
+
+DEFAULT_BASE_TIMEOUT = 30
+DEFAULT_SECONDS_PER_MB = 0.5
+DEFAULT_MAX_TIMEOUT = 1800
+# Repositories the GitHub API reports as bigger than this are cloned after all the others
+DEFAULT_DEFER_SIZE_MB = 1024
+
+# Never sit on a credential prompt for a private, renamed or deleted repository
+GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+
+
+# Scale the clone timeout with the repository size the GitHub API reports (in KB),
+# so large repositories get time to finish instead of being killed after 30 seconds
+def clone_timeout(size_kb, base_timeout=DEFAULT_BASE_TIMEOUT, seconds_per_mb=DEFAULT_SECONDS_PER_MB,
+                  max_timeout=DEFAULT_MAX_TIMEOUT):
+    if not size_kb:
+        return base_timeout
+    return min(max_timeout, base_timeout + (size_kb / 1024) * seconds_per_mb)
+
+
+# Clone stage priority: repositories that need no clone pass straight through, then the largest
+# first, so the longest clones start early instead of finishing the run alone on one worker
+def clone_priority(clone_requested, size_kb):
+    return math.inf if not clone_requested else (size_kb or 0)
+
+
+# Should the clone wait until every repository within defer_size_mb is done? 0 or None never defers.
+def is_deferred(clone_requested, size_kb, defer_size_mb):
+    return bool(clone_requested and defer_size_mb and (size_kb or 0) > defer_size_mb * 1024)
+
+
+# Only the workflow definitions are needed to look for pull_request_target triggers
+WORKFLOW_SPARSE_PATHS = ["/.github/workflows/"]
+
+
+# depth=0 clones the full history; blobless=True adds --filter=blob:none so only the
+# blobs needed for the checkout are downloaded; reference borrows objects from a shared
+# repository through git alternates (see repo_store)
+def clone_command(clone_url, repo_path, depth=1, blobless=False, no_checkout=False, bare=False, reference=None):
+    cmd = ["git", "clone", "--quiet"]
+    if bare:
+        cmd += ["--bare"]
+    if reference:
+        cmd += ["--reference-if-able", str(reference)]
+    if depth:
+        cmd += ["--depth", str(depth)]
+    if blobless:
+        cmd += ["--filter=blob:none"]
+    if no_checkout:
+        cmd += ["--no-checkout"]
+    return cmd + [clone_url, str(repo_path)]
+
+
+# A sparse clone is a blobless clone without checkout, restricted to sparse_paths
+# (non-cone gitignore-style patterns) before checking out, so git only downloads
+# the blobs under those paths
+def clone_commands(clone_url, repo_path, depth=1, blobless=False, sparse_paths=None, reference=None):
+    if not sparse_paths:
+        return [clone_command(clone_url, repo_path, depth, blobless, reference=reference)]
+    return [
+        clone_command(clone_url, repo_path, depth, blobless=True, no_checkout=True),
+        ["git", "-C", str(repo_path), "sparse-checkout", "set", "--no-cone", *sparse_paths],
+        ["git", "-C", str(repo_path), "checkout", "--quiet"],
+    ]
+
+
+# Bring an existing bare mirror up to date: fetch the remote HEAD straight into the branch the
+# mirror's HEAD points at (a bare clone has no remote-tracking refs), blobless like the clone
+def fetch_mirror_command(mirror_path, depth=1):
+    head = (Path(mirror_path) / "HEAD").read_text().strip()
+    ref = head[len("ref: "):] if head.startswith("ref: ") else "HEAD"
+    cmd = ["git", "--git-dir", str(mirror_path), "fetch", "--quiet", "--filter=blob:none"]
+    if depth:
+        cmd += ["--depth", str(depth)]
+    return cmd + ["origin", f"+HEAD:{ref}"]
+
+
+# bare=True keeps a blobless bare mirror at <repos_dir>/<org>/<repo>.git instead of a working
+# tree; an existing mirror is fetched rather than skipped. Blobs are downloaded lazily when read.
+# A reference repository only works with plain working tree clones.
+def clone_repository(org, repo, repos_dir, depth=1, blobless=False, timeout=DEFAULT_BASE_TIMEOUT,
+                     sparse_paths=None, bare=False, reference=None):
+    if reference and (bare or sparse_paths):
+        raise ValueError("a reference repository cannot be used for bare or sparse clones")
+    repo_path = Path(repos_dir) / org / (f"{repo}.git" if bare else repo)
+    if repo_path.exists() and not bare:
+        return CloneResult(org, repo, repo_path, EXISTS, timeout, 0.0, None)
+
+    clone_url = f"https://github.com/{org}/{repo}.git"
+    if bare and repo_path.exists():
+        status = UPDATED
+        commands = [fetch_mirror_command(repo_path, depth)]
+    elif bare:
+        status = CLONED
+        commands = [clone_command(clone_url, repo_path, depth, blobless=True, bare=True)]
+    else:
+        status = CLONED
+        commands = clone_commands(clone_url, repo_path, depth, blobless, sparse_paths, reference)
+    repo_path.parent.mkdir(parents=True, exist_ok=True)
+
+    start = time.monotonic()
+    try:
+        # The timeout covers all steps of a sparse clone together
+        for cmd in commands:
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                raise TimeoutExpired(cmd, timeout)
+            instrumentation.run(cmd, check=True, capture_output=True, text=True, timeout=remaining, env=GIT_ENV)
+        return CloneResult(org, repo, repo_path, status, timeout, time.monotonic() - start, None)
+    except TimeoutExpired:
+        # Clean up the partially cloned repository, a mirror that failed to update is kept as it was
+        if status == CLONED:
+            shutil.rmtree(repo_path, ignore_errors=True)
+        return CloneResult(org, repo, repo_path, TIMEOUT, timeout, time.monotonic() - start, None)
+    except subprocess.CalledProcessError as e:
+        if status == CLONED:
+            shutil.rmtree(repo_path, ignore_errors=True)
+        return CloneResult(org, repo, repo_path, FAILED, timeout, time.monotonic() - start, e.stderr)
+
+
+# A clone killed mid-way (e.g. by SIGKILL) leaves a directory without a checked out commit.
+# Remove it so the repository can be cloned again; returns True when something was removed.
+def remove_partial_clone(repo_path):
+    repo_path = Path(repo_path)
+    if not repo_path.exists():
+        return False
+    result = instrumentation.run(["git", "-C", str(repo_path), "rev-parse", "--verify", "--quiet", "HEAD^{commit}"],
+                                 capture_output=True, text=True, env=GIT_ENV)
+    if result.returncode == 0:
+        return False
+    shutil.rmtree(repo_path, ignore_errors=True)
+    return True
+
+
+# Clone settings shared by the clone stage workers. clone() runs one clone on the calling
+# thread; callback, when given, is called there with the CloneResult of every finished
+# clone. summary() reports the clone time of the run.
+class ClonePool:
+    def __init__(self, repos_dir, workers=4, depth=1, blobless=False, base_timeout=DEFAULT_BASE_TIMEOUT,
+                 callback=None, sparse_paths=None, bare=False, reference=None):
+        if reference and (bare or sparse_paths):
+            raise ValueError("a reference repository cannot be used for bare or sparse clones")
+        self.repos_dir = Path(repos_dir)
+        self.bare = bare
+        self.reference = reference
+        self.depth = depth
+        self.blobless = blobless
+        self.sparse_paths = sparse_paths
+        self.base_timeout = base_timeout
+        self.callback = callback
+        self.workers = workers
+        self.results = []
+        self._lock = threading.Lock()
+
+    # Where clone_repository puts org/repo
+    def path(self, org, repo):
+        return self.repos_dir / org / (f"{repo}.git" if self.bare else repo)
+
+    def clone(self, org, repo, size_kb=None):
+        timeout = clone_timeout(size_kb, base_timeout=self.base_timeout)
+        result = clone_repository(org, repo, self.repos_dir, self.depth, self.blobless, timeout,
+                                  sparse_paths=self.sparse_paths, bare=self.bare, reference=self.reference)
+        logger.debug(f"Clone {org}/{repo}: {result.status} in {result.elapsed:.1f}s (timeout {timeout:.0f}s)")
+        with self._lock:
+            self.results.append(result)
+        if self.callback is not None:
+            self.callback(result)
+        return result
+
+    # Clone time of the run so far: attempts, summed and longest clone time, and the statuses
+    def summary(self):
+        with self._lock:
+            results = list(self.results)
+        longest = max(results, key=lambda r: r.elapsed, default=None)
+        statuses = {}
+        for result in results:
+            statuses[result.status] = statuses.get(result.status, 0) + 1
+        return {"clones": len(results), "clone_seconds": round(sum(r.elapsed for r in results), 3),
+                "longest": f"{longest.org}/{longest.repo}" if longest else None,
+                "longest_seconds": round(longest.elapsed, 3) if longest else 0.0, "statuses": statuses}
@@ -0,0 +1,271 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+import http_cassette
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+
+# Optional cap on requests per second; by default only the rate-limit budget and the
+# concurrency limit hold requests back
+DEFAULT_MAX_RATE = None
+DEFAULT_BURST = 10
+# GitHub allows up to 100 concurrent requests before secondary rate limits kick in; stay well below
+DEFAULT_MAX_CONCURRENCY = 16
+# Start pacing once the remaining budget, less the requests in flight and waiting, drops to this
+DEFAULT_RESERVE = 100
+
+# Give up on a request that is still throttled after this many waits
+MAX_THROTTLED_RETRIES = 10
+
+
+# Rate-limit budget plus an adaptive concurrency limit for one GitHub rate-limit resource
+# ("core", "graphql", ...). Requests go out as fast as the concurrency limit allows while
+# X-RateLimit-Remaining covers the requests in flight and waiting; once it drops to the reserve,
+# a token bucket spreads what is left over the rest of the window until X-RateLimit-Reset.
+# An exhausted budget pauses every caller until the reset, and secondary rate limits halve
+# the concurrency limit (recovering additively on success).
+class RateLimitGovernor:
+    def __init__(self, max_rate=DEFAULT_MAX_RATE, burst=DEFAULT_BURST, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 reserve=DEFAULT_RESERVE):
+        self.max_rate = max_rate
+        self.rate = None
+        self.burst = burst
+        self.tokens = float(burst)
+        self.reserve = reserve
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self.remaining = None
+        self.reset_at = None
+        self._reset_deadline = None
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    # Requests per second to pace at, or None while the budget covers the pending demand
+    def _pace(self, now):
+        if self.remaining is None or self._reset_deadline is None or now >= self._reset_deadline:
+            rate = None
+        elif self.remaining - self.in_flight > self.reserve + self.waiting:
+            rate = None
+        else:
+            window = max(1.0, self._reset_deadline - now)
+            rate = max(self.remaining - self.in_flight, 1) / window
+        if self.max_rate is not None:
+            rate = self.max_rate if rate is None else min(rate, self.max_rate)
+        return rate
+
+    def _refill(self, now, rate):
+        if rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * rate)
+        else:
+            self.tokens = float(self.burst)
+        self._updated = now
+
+    # Block until a request may be sent: not paused, below the concurrency limit and, while
+    # pacing, a token available. Returns True when the request was charged a token.
+    @instrumentation.timed("github_governor_wait")
+    def acquire(self):
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    rate = self.rate = self._pace(now)
+                    self._refill(now, rate)
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif self.in_flight >= int(self.concurrency):
+                        wait = None
+                    elif rate is None:
+                        self.in_flight += 1
+                        return False
+                    elif self.tokens < 1:
+                        wait = (1 - self.tokens) / rate
+                    else:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return True
+                    self._cond.wait(timeout=wait)
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    # Yields whether the request was charged a token
+    @contextmanager
+    def slot(self):
+        charged = self.acquire()
+        try:
+            yield charged
+        finally:
+            self.release()
+
+    # Pause every caller for delay seconds
+    def pause(self, delay, reason):
+        with self._cond:
+            until = time.monotonic() + delay
+            if until > self.paused_until:
+                self.paused_until = until
+                logger.warning(f"GitHub {reason}, pausing requests for {delay:.0f}s")
+            self._cond.notify_all()
+
+    # Adjust to the rate-limit headers of a response. A 304 costs no quota, so the token it
+    # was charged (charged=True) goes back into the bucket.
+    def update(self, response, charged=False):
+        headers = response.headers
+        with self._cond:
+            if "X-RateLimit-Remaining" in headers and "X-RateLimit-Reset" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+                self.reset_at = int(headers["X-RateLimit-Reset"])
+                self._reset_deadline = time.monotonic() + max(0.0, seconds_until(self.reset_at, headers))
+            if response.status_code == 304 and charged:
+                self.tokens = min(self.burst, self.tokens + 1)
+
+            # Additive increase after every response that was not throttled
+            if response.status_code < 400:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / max(1.0, self.concurrency))
+            self._cond.notify_all()
+
+    # Multiplicative decrease after hitting a secondary rate limit
+    def back_off(self):
+        with self._cond:
+            self.concurrency = max(1.0, self.concurrency / 2)
+
+
+# Seconds from the server's clock (Date header) until the epoch timestamp reset_at, so local
+# clock skew doesn't make us wake up too early or sleep too long
+def seconds_until(reset_at, headers):
+    now = time.time()
+    if "Date" in headers:
+        try:
+            now = parsedate_to_datetime(headers["Date"]).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return reset_at - now
+
+
+# How long to wait before retrying a throttled response, or None when it wasn't throttled
+def throttle_delay(response):
+    headers = response.headers
+    if response.status_code not in (403, 429):
+        return None
+    if "Retry-After" in headers:
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            return 60.0
+    if headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in headers:
+        return max(1.0, seconds_until(int(headers["X-RateLimit-Reset"]), headers) + 1)
+    # Secondary rate limits without Retry-After: GitHub recommends waiting at least a minute
+    if response.status_code == 429 or "secondary rate limit" in response.text.lower():
+        return 60.0
+    return None
+
+
+# Shared GitHub API client: one pooled requests.Session, rate-limit governors per resource,
+# transparent waits on primary and secondary rate limits, and an optional ResponseCache
+# (http_cache) for conditional requests
+class GitHubClient:
+    def __init__(self, token, cache=None, pool_size=DEFAULT_MAX_CONCURRENCY, max_retries=5, backoff_factor=0.5,
+                 timeout=10, max_rate=DEFAULT_MAX_RATE, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Offline record/replay for benchmarks, only active when RECON_CASSETTE is set
+        http_cassette.install_from_env(self.session)
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.governors = {
+            "core": RateLimitGovernor(max_rate=max_rate, max_concurrency=max_concurrency),
+            "graphql": RateLimitGovernor(max_rate=max_rate, max_concurrency=max_concurrency),
+        }
+
+    def governor_for(self, url):
+        return self.governors["graphql" if url.startswith(GITHUB_GRAPHQL_URL) else "core"]
+
+    # Send a request, waiting out rate limits and retrying connection errors with exponential
+    # backoff. Returns the final response (any status) or raises the last connection error.
+    def request(self, method, url, headers=None, **kwargs):
+        # Includes rate-limit waits and retries, http_request spans time the requests themselves
+        with instrumentation.span("github_request", method=method):
+            return self._request(method, url, headers, **kwargs)
+
+    def _request(self, method, url, headers=None, **kwargs):
+        governor = self.governor_for(url)
+        kwargs.setdefault("timeout", self.timeout)
+        use_cache = self.cache is not None and method == "GET"
+        headers = dict(headers or {})
+        if use_cache:
+            headers.update(self.cache.conditional_headers(url))
+
+        attempt = throttled = 0
+        while True:
+            try:
+                with governor.slot() as charged:
+                    response = instrumentation.request(self.session, method, url, headers=headers, **kwargs)
+            except (ConnectionError, Timeout):
+                attempt += 1
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_factor * (2 ** attempt))
+                continue
+
+            governor.update(response, charged)
+            delay = throttle_delay(response)
+            if delay is not None and throttled < MAX_THROTTLED_RETRIES:
+                throttled += 1
+                instrumentation.count("github_throttled")
+                # Rate limits are waited out rather than counted as failures
+                if response.headers.get("X-RateLimit-Remaining") != "0":
+                    governor.back_off()
+                governor.pause(delay, f"rate limit on {url}")
+                continue
+
+            if use_cache:
+                if response.status_code == 304:
+                    cached_response = self.cache.load(url)
+                    if cached_response is not None:
+                        instrumentation.count("http_cache_hits")
+                        return cached_response
+                    # The entry vanished between the lookup and the response, retry unconditionally
+                    headers.pop("If-None-Match", None)
+                    headers.pop("If-Modified-Since", None)
+                    use_cache = False
+                    continue
+                self.cache.store(url, response)
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def rate_limit_summary(self):
+        return {name: {"remaining": governor.remaining, "reset_at": governor.reset_at,
+                       "rate": None if governor.rate is None else round(governor.rate, 3), "concurrency": int(governor.concurrency)}
+                for name, governor in self.governors.items()}
@@ -0,0 +1,98 @@
+import logging
+
+from requests.exceptions import RequestException
+
+from github_client import GITHUB_GRAPHQL_URL
+
+logger = logging.getLogger(__name__)
+
+# GitHub caps a query at 500,000 nodes; 50 repositories with 100 languages each stays far below that
+DEFAULT_BATCH_SIZE = 50
+
+REPOSITORY_FIELDS = """
+fragment RepositoryFields on Repository {
+  nameWithOwner
+  owner { __typename login }
+  diskUsage
+  isFork
+  isArchived
+  stargazerCount
+  defaultBranchRef { name }
+  languages(first: 100, orderBy: {field: SIZE, direction: DESC}) { nodes { name } }
+}
+"""
+
+
+# Build one query that looks up every (owner, name) pair through a numbered alias,
+# passing the names as variables so nothing needs escaping
+def build_query(batch):
+    params = []
+    selections = []
+    variables = {}
+    for i, (owner, name) in enumerate(batch):
+        params.append(f"$o{i}: String!, $n{i}: String!")
+        selections.append(f"  r{i}: repository(owner: $o{i}, name: $n{i}) {{ ...RepositoryFields }}")
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = name
+    query = f"query({', '.join(params)}) {{\n" + "\n".join(selections) + "\n}\n" + REPOSITORY_FIELDS
+    return query, variables
+
+
+# Convert a GraphQL repository node into the subset of the REST /repos/{owner}/{repo}
+# payload the scrapers use, plus the language list from /languages
+def to_rest_shape(node):
+    owner = node["owner"]
+    repo_data = {
+        "full_name": node["nameWithOwner"],
+        "owner": {"login": owner["login"], "type": owner["__typename"]},
+        "size": node["diskUsage"],
+        "fork": node["isFork"],
+        "archived": node["isArchived"],
+        "stargazers_count": node["stargazerCount"],
+        "default_branch": (node.get("defaultBranchRef") or {}).get("name"),
+        "languages": [language["name"] for language in node["languages"]["nodes"]],
+    }
+    # The REST API only includes "organization" for organization-owned repositories
+    if owner["__typename"] == "Organization":
+        repo_data["organization"] = {"login": owner["login"]}
+    return repo_data
+
+
+# Retries and rate limits are handled by the GitHubClient
+def post_query(client, query, variables):
+    try:
+        response = client.post(GITHUB_GRAPHQL_URL, json={"query": query, "variables": variables}, timeout=30)
+        response.raise_for_status()
+        return response.json()
+    except (RequestException, ValueError) as e:
+        logger.error(f"GraphQL request error: {str(e)}")
+        return None
+
+
+# Fetch metadata for many repositories, batch_size per query.
+# Returns {(owner, name): repo_data}; repositories missing from the result (failed batch,
+# NOT_FOUND, insufficient scopes) should be looked up through the REST API instead.
+def fetch_repo_metadata(repos, client, batch_size=DEFAULT_BATCH_SIZE):
+    repos = list(dict.fromkeys(repos))
+    metadata = {}
+
+    for start in range(0, len(repos), batch_size):
+        batch = repos[start:start + batch_size]
+        query, variables = build_query(batch)
+        result = post_query(client, query, variables)
+        if result is None:
+            logger.warning(f"GraphQL batch of {len(batch)} repositories failed, falling back to REST")
+            continue
+
+        for error in result.get("errors", []):
+            logger.warning(f"GraphQL error: {error.get('message')}")
+
+        data = result.get("data") or {}
+        for i, key in enumerate(batch):
+            node = data.get(f"r{i}")
+            if node is not None:
+                metadata[key] = to_rest_shape(node)
+
+    logger.info(f"GraphQL resolved {len(metadata)}/{len(repos)} repositories "
+                f"in {(len(repos) + batch_size - 1) // batch_size} queries")
+    return metadata
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+# On-disk cache of GitHub API responses keyed by URL.
+#
+# Each entry stores the body together with its ETag / Last-Modified validators so
+# the next request can be made conditional. GitHub answers unchanged resources with
+# a 304 that does not count against the rate limit, and the cached body is served
+# instead. Entries are evicted least-recently-used once the cache exceeds max_bytes.
+class ResponseCache:
+    def __init__(self, cache_dir, max_bytes=100 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._total_bytes = sum(p.stat().st_size for p in self.cache_dir.glob("*.json"))
+
+    def _path(self, url):
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def _read(self, url):
+        path = self._path(url)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # A hash collision is practically impossible, but never serve another URL's body
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    # Headers to add to a request so the server can answer with 304 Not Modified
+    def conditional_headers(self, url):
+        entry = self._read(url)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    # Rebuild a 200 response from the stored entry after the server answered 304
+    def load(self, url):
+        entry = self._read(url)
+        if entry is None:
+            return None
+
+        # Touch the entry so eviction treats it as recently used
+        os.utime(self._path(url))
+        with self._lock:
+            self.hits += 1
+
+        response = requests.Response()
+        response.status_code = entry["status_code"]
+        response.url = url
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.from_cache = True
+        return response
+
+    @instrumentation.timed("file_write", target="http_cache")
+    def store(self, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return
+
+        entry = {
+            "url": url,
+            "status_code": response.status_code,
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": dict(response.headers),
+            "body": response.text,
+            "stored_at": time.time(),
+        }
+        path = self._path(url)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+
+        with self._lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._total_bytes += path.stat().st_size - old_size
+            over_budget = self._total_bytes > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+    # Remove least-recently-used entries until the cache is back under 90% of max_bytes,
+    # leaving some headroom so a full cache doesn't rescan the directory on every store
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for path in self.cache_dir.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            low_water = self.max_bytes * 0.9
+            entries.sort()
+            for _, size, path in entries:
+                if total <= low_water:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                logger.debug(f"Evicted cached response: {path.name}")
+            self._total_bytes = total
+
+    def clear(self):
+        with self._lock:
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+            self._total_bytes = 0
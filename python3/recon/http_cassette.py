@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# Set RECON_CASSETTE to a .jsonl file to record or replay every request the recon scripts make
+CASSETTE_ENV = "RECON_CASSETTE"
+# "replay" (default) or "record"
+MODE_ENV = "RECON_CASSETTE_MODE"
+# Sleep this long before every request, to replay a run with realistic network latency
+LATENCY_ENV = "RECON_CASSETTE_LATENCY_MS"
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Headers that describe the wire encoding rather than the recorded (already decoded) body
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+
+class CassetteMiss(RequestException):
+    pass
+
+
+# Interactions are matched on method and URL, plus a hash of the body for POSTs (GraphQL)
+def request_key(method, url, body=None):
+    if isinstance(body, str):
+        body = body.encode()
+    if body:
+        return f"{method} {url} {hashlib.sha256(body).hexdigest()[:16]}"
+    return f"{method} {url}"
+
+
+# Recorded responses as JSON lines, one interaction per line. Repeated requests replay their
+# recorded responses in order and then keep returning the last one.
+class Cassette:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.interactions = {}
+        self._served = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self.interactions.setdefault(interaction["key"], []).append(interaction["response"])
+
+    def next(self, key):
+        with self._lock:
+            responses = self.interactions.get(key)
+            if not responses:
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            return responses[min(served, len(responses) - 1)]
+
+    def record(self, key, response):
+        entry = {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS},
+        }
+        try:
+            entry["body"] = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(response.content).decode()
+        with self._lock:
+            self.interactions.setdefault(key, []).append(entry)
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a")
+            self._file.write(json.dumps({"key": key, "response": entry}, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+
+# Transport adapter that records real responses into a Cassette or serves them back from it.
+# Only method, URL and the response are stored, never request headers such as Authorization.
+class CassetteAdapter(HTTPAdapter):
+    def __init__(self, cassette, mode=REPLAY, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        key = request_key(request.method, request.url, request.body)
+
+        if self.mode == RECORD:
+            response = super().send(request, **kwargs)
+            self.cassette.record(key, response)
+            return response
+
+        entry = self.cassette.next(key)
+        if entry is None:
+            raise CassetteMiss(f"No recorded response for {key}", request=request)
+        response = Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = base64.b64decode(entry["body_b64"]) if "body_b64" in entry else entry["body"].encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+# One Cassette per file, shared by every session that records to or replays from it
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+# Mount a CassetteAdapter on session when RECON_CASSETTE is set; returns the adapter or None
+def install_from_env(session):
+    path = os.environ.get(CASSETTE_ENV)
+    if not path:
+        return None
+    mode = os.environ.get(MODE_ENV, REPLAY)
+    latency = float(os.environ.get(LATENCY_ENV, 0)) / 1000
+    with _cassettes_lock:
+        cassette = _cassettes.setdefault(path, Cassette(path))
+    adapter = CassetteAdapter(cassette, mode=mode, latency=latency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    logger.info(f"HTTP cassette {mode}: {path} ({latency * 1000:.0f} ms injected latency)")
+    return adapter
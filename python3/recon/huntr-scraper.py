@@ -1,25 +1,85 @@
 from enum import Enum
 from rich.console import Console
 from rich.style import Style
-from rich.table import Table, box
-from rich.logging import RichHandler
+from rich.table import box
 
-import requests
 from requests.exceptions import RequestException, ConnectionError, Timeout
-import time
 
-from bs4 import BeautifulSoup
+import math
 import os
 import sys
-import json
-from pprint import pprint
-from urllib.parse import unquote
-import csv
 import logging
 from datetime import datetime
-import subprocess
-from subprocess import TimeoutExpired
 from pathlib import Path
+import argparse
+import threading
+
+from http_cache import ResponseCache
+from github_client import GitHubClient
+from github_graphql import DEFAULT_BATCH_SIZE, fetch_repo_metadata
+from huntr_listing import HUNTR_BOUNTIES_URL, HTML_PARSER, fetch_listing_page
+import clone_pool
+from recon_logging import setup_logging
+import instrumentation
+from results_store import ResultsStore
+from repo_store import RepoStore
+from stream_output import StreamingTable, DEFAULT_WINDOW
+from run_journal import RunJournal, RUN_STARTED, SCRAPED, SCRAPE_COMPLETE, ENRICHED, CLONED, RUN_FINISHED
+from pipeline import Pipeline, Stage, DEFAULT_QUEUE_SIZE
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Scrape huntr.com bounty programs and enrich them with GitHub metadata")
+parser.add_argument("--concurrency", "-c", type=int, default=8,
+                    help="Number of repositories to enrich in parallel, 1 restores serial enrichment (default: 8)")
+parser.add_argument("--no-cache", action="store_true",
+                    help="Disable the on-disk ETag cache for GitHub API responses")
+parser.add_argument("--cache-size", type=int, default=100,
+                    help="Maximum size of the GitHub API response cache in MB (default: 100)")
+parser.add_argument("--graphql", action="store_true",
+                    help="Fetch repository details and languages through batched GraphQL queries, falling back to REST")
+parser.add_argument("--graphql-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                    help=f"Repositories per GraphQL query (default: {DEFAULT_BATCH_SIZE})")
+parser.add_argument("--clone-workers", type=int, default=4,
+                    help="Number of repositories to clone in parallel (default: 4)")
+parser.add_argument("--clone-depth", type=int, default=1,
+                    help="History depth for clones, 0 clones the full history (default: 1)")
+parser.add_argument("--defer-size", type=float, default=clone_pool.DEFAULT_DEFER_SIZE_MB,
+                    help="Clone repositories bigger than this many MB after all the others, 0 never defers "
+                         f"(default: {clone_pool.DEFAULT_DEFER_SIZE_MB})")
+parser.add_argument("--skip-deferred", action="store_true",
+                    help="Leave the repositories over --defer-size out of this run instead of cloning them last")
+parser.add_argument("--blobless", action="store_true",
+                    help="Clone with --filter=blob:none, most useful together with --clone-depth 0")
+parser.add_argument("--clone-timeout", type=int, default=clone_pool.DEFAULT_BASE_TIMEOUT,
+                    help=f"Base clone timeout in seconds, extended by repo size (default: {clone_pool.DEFAULT_BASE_TIMEOUT})")
+parser.add_argument("--pages", type=int, default=1,
+                    help="Number of bounty listing pages to fetch in parallel (default: 1)")
+parser.add_argument("--scrape-workers", type=int, default=4,
+                    help="Number of bounty listing pages fetched at once (default: 4)")
+parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                    help=f"Repositories buffered between pipeline stages (default: {DEFAULT_QUEUE_SIZE})")
+parser.add_argument("--shared-objects", action="store_true",
+                    help="Store objects shared between clones (forks, mirrors) once, in a reference repository")
+parser.add_argument("--disk-budget", type=float,
+                    help="Evict the least recently scanned clones once they take more than this many GB")
+parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                    help=f"Rows shown in the live results table, every row goes to the CSV and table files (default: {DEFAULT_WINDOW})")
+parser.add_argument("--metrics", type=Path,
+                    help="Write span, counter and histogram totals here at exit, Prometheus text for .prom files, "
+                         "JSON otherwise (default: $RECON_METRICS)")
+parser.add_argument("--trace", type=Path,
+                    help="Append every timed span (HTTP request, git command, parse, file write) to this JSONL file")
+parser.add_argument("--profile", type=Path,
+                    help="Profile every thread with cProfile and write the stats here at exit")
+parser.add_argument("--log-level", default="DEBUG", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                    help="Minimum level written to the JSONL log file (default: DEBUG)")
+parser.add_argument("--resume", action="store_true",
+                    help="Continue the last unfinished run from its journal, skipping work that already completed")
+args = parser.parse_args()
+if args.concurrency < 1:
+    parser.error("--concurrency must be at least 1")
+if args.shared_objects and (args.blobless or args.clone_depth != 0):
+    parser.error("--shared-objects needs full clones with full history: --clone-depth 0 and no --blobless")
 
 # Setup base directories
 home_dir = Path.home()
@@ -27,23 +87,23 @@ base_dir = home_dir / "git" / "bounties"
 log_dir = base_dir / "logs"
 output_dir = base_dir / "output"
 repos_dir = base_dir / "repositories"
+cache_dir = base_dir / "cache" / "http"
+db_path = base_dir / "results.db"
+state_dir = base_dir / "state"
+journal_dir = state_dir / "journal"
 
 # Create necessary directories
 for directory in [log_dir, output_dir, repos_dir]:
     directory.mkdir(parents=True, exist_ok=True)
 
-# Setup logging
-log_filename = log_dir / f"log_output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        RichHandler(),
-        logging.FileHandler(str(log_filename))
-    ]
-)
+# Setup logging, formatting and file I/O happen on a background listener thread
+log_filename = setup_logging(log_dir, level=getattr(logging, args.log_level))
+
+# Time HTTP requests, git commands, parsing and file writes; exported at exit
+instrumentation.install_from_env(metrics=args.metrics, trace=args.trace, profile=args.profile)
 
-CONSOLE = Console(record=True)
+# Nothing is recorded: results are streamed to their files as they are produced
+CONSOLE = Console()
 
 # Define the message types
 class MessageType(Enum):
@@ -68,60 +128,85 @@ emojis = {
     MessageType.INFO: ":information_source:",  # ℹ️
 }
 
+# Log levels for print_message records in the log file
+log_levels = {
+    MessageType.SUCCESS: logging.INFO,
+    MessageType.WARN: logging.WARNING,
+    MessageType.FATAL: logging.ERROR,
+    MessageType.INFO: logging.INFO,
+}
+
 # Function to print messages with styles and emojis
 def print_message(message_type, message):
     style = styles.get(message_type, Style())
     emoji = emojis.get(message_type, "")
     CONSOLE.print(f"{emoji} {message}", style=style)
-    logging.info(f"{emoji} {message}")
+    # Already on the console, so this record only goes to the log file
+    logging.log(log_levels.get(message_type, logging.INFO), message.strip(), extra={"printed": True})
 
 print_message(MessageType.SUCCESS, f"Instantiated logging: {log_filename}\n")
 
-# Function to clone repositories
-def clone_repo(org, repo):
-    repo_path = repos_dir / org / repo
-    
-    if repo_path.exists():
-        print_message(MessageType.WARN, f"Directory already exists: {repo_path}")
-        return False
-    
-    repo_path.parent.mkdir(parents=True, exist_ok=True)
-    clone_url = f"https://github.com/{org}/{repo}.git"
-    
-    try:
-        subprocess.run(["git", "clone", clone_url, str(repo_path)], 
-                       check=True, capture_output=True, text=True, timeout=30)
-        print_message(MessageType.SUCCESS, f"Cloned repository: {clone_url} to {repo_path}")
-        return True
-    except TimeoutExpired:
-        print_message(MessageType.FATAL, f"Cloning repository timed out after 30 seconds: {clone_url}")
-        logging.error(f"Git clone timeout: {clone_url}")
-        # Clean up the partially cloned repository
-        if repo_path.exists():
-            subprocess.run(["rm", "-rf", str(repo_path)])
-        return False
-    except subprocess.CalledProcessError as e:
+# SQLite store of every run's results
+results_store = ResultsStore(db_path)
+
+# Append-only journal of completed work, --resume continues the last unfinished run
+journal = RunJournal.latest_unfinished(journal_dir, "huntr-scraper") if args.resume else None
+if journal is not None:
+    print_message(MessageType.SUCCESS, f"Resuming from journal: {journal.path} "
+                                       f"({len(journal.state.enriched)} enriched, {len(journal.state.cloned)} cloned)\n")
+else:
+    if args.resume:
+        print_message(MessageType.WARN, "No unfinished run to resume, starting a new run\n")
+    journal = RunJournal.create(journal_dir, "huntr-scraper")
+
+# Setup the GitHub API response cache
+if args.no_cache:
+    response_cache = None
+    print_message(MessageType.WARN, "GitHub API response cache disabled\n")
+else:
+    response_cache = ResponseCache(cache_dir, max_bytes=args.cache_size * 1024 * 1024)
+    print_message(MessageType.SUCCESS, f"Using GitHub API response cache: {cache_dir}\n")
+
+# Clones on disk: shared reference objects and last-scan times for --disk-budget eviction
+repo_store = RepoStore(state_dir / "repo_store.json",
+                       reference=base_dir / "objects.git" if args.shared_objects else None)
+
+# Function to report finished clones, called from the clone stage workers
+def report_clone(result):
+    clone_url = f"https://github.com/{result.org}/{result.repo}.git"
+    if result.status in (clone_pool.CLONED, clone_pool.EXISTS):
+        repo_store.add_clone(f"{result.org}/{result.repo}", result.path, result.status == clone_pool.CLONED)
+        journal.record(CLONED, result.org, result.repo, {"status": result.status})
+    if result.status == clone_pool.EXISTS:
+        print_message(MessageType.WARN, f"Directory already exists: {result.path}")
+    elif result.status == clone_pool.CLONED:
+        print_message(MessageType.SUCCESS, f"Cloned repository: {clone_url} to {result.path} in {result.elapsed:.1f}s")
+    elif result.status == clone_pool.TIMEOUT:
+        print_message(MessageType.FATAL, f"Cloning repository timed out after {result.timeout:.0f} seconds: {clone_url}")
+        logging.error(f"Git clone timeout: {clone_url}", extra={"printed": True})
+    else:
         print_message(MessageType.FATAL, f"Failed to clone repository: {clone_url}")
-        logging.error(f"Git clone error: {e.stderr}")
-        return False
-
-# Function for retrying requests
-def make_request_with_retry(url, headers, error_message, max_retries=3, backoff_factor=0.3):
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response
-        except (ConnectionError, Timeout) as e:
-            if attempt == max_retries - 1:
-                print_message(MessageType.FATAL, f"{error_message}: {url}")
-                logging.error(f"Connection error: {str(e)}")
-                return None
-            time.sleep(backoff_factor * (2 ** attempt))
-        except RequestException as e:
-            print_message(MessageType.FATAL, f"{error_message}: {url}")
-            logging.error(f"Request error: {str(e)}")
-            return None
+        logging.error(f"Git clone error: {result.error}", extra={"printed": True})
+
+# Clone settings for the clone stage: shallow and/or blobless, with timeouts scaled to repo size
+clone_workers = clone_pool.ClonePool(repos_dir, workers=args.clone_workers, depth=args.clone_depth,
+                                     blobless=args.blobless, base_timeout=args.clone_timeout,
+                                     callback=report_clone, reference=repo_store.reference)
+
+# Function for GitHub API requests. Retries, rate limits and caching are handled by the shared GitHub client
+def make_request_with_retry(url, headers, error_message):
+    try:
+        response = github.get(url, headers=headers)
+        response.raise_for_status()
+        return response
+    except (ConnectionError, Timeout) as e:
+        print_message(MessageType.FATAL, f"{error_message}: {url}")
+        logging.error(f"Connection error: {str(e)}", extra={"printed": True})
+        return None
+    except RequestException as e:
+        print_message(MessageType.FATAL, f"{error_message}: {url}")
+        logging.error(f"Request error: {str(e)}", extra={"printed": True})
+        return None
 
 # Check if the GitHub token is set
 github_token = os.getenv('GITHUB_TOKEN')
@@ -129,38 +214,8 @@ if not github_token:
     print_message(MessageType.FATAL, "Error: GITHUB_TOKEN environment variable is not set.")
     sys.exit(1)
 
-print_message(MessageType.INFO, f"Scraping programs from https://huntr.com/bounties..\n")
-
-# Make a GET request to the URL
-url = 'https://huntr.com/bounties'
-response = requests.get(url)
-
-# Parse the HTML content using BeautifulSoup
-soup = BeautifulSoup(response.content, 'html.parser')
-
-print_message(MessageType.INFO, f"Parsing program info..\n")
-
-# Find all bounty items
-bounty_items = soup.find_all('div', class_='group flex flex-row')
-
-# Extract and print the organization and repo information
-repos = []
-for item in bounty_items:
-    # Extract organization from img tag
-    img_tag = item.find('img', alt='Repo')
-    if img_tag:
-        src_url = img_tag['src']
-        decoded_url = unquote(src_url)
-        organization = decoded_url.split('/')[-1].split('.')[0]
-    
-    # Extract repo from span tag
-    span_tag = item.find('span')
-    if span_tag:
-        repo = span_tag.text.strip()
-    
-    if organization and repo:
-        print_message(MessageType.INFO, f"Organization: {organization}, Repo: {repo}")
-        repos.append((organization, repo))
+# Pooled GitHub API session with an adaptive rate-limit governor
+github = GitHubClient(github_token, cache=response_cache, pool_size=args.concurrency)
 
 # GitHub API base URL
 github_api_base_url = 'https://api.github.com/repos'
@@ -172,92 +227,224 @@ headers = {
     'X-GitHub-Api-Version': '2022-11-28'
 }
 
-print_message(MessageType.INFO, f"Writing results to CSV and console ..\n")
+# Headers as they may appear in the log file, without the token
+loggable_headers = {k: v for k, v in headers.items() if k != 'Authorization'}
 
-# Create a table for console output
-table = Table(
-    title="GitHub Repositories",
-    box=box.MINIMAL_HEAVY_HEAD,
-    show_lines=True,
-    title_style="bold magenta",
-    header_style="bold cyan"
-)
-table.add_column("Organization", style="cyan", no_wrap=True)
-table.add_column("Repo", style="magenta", no_wrap=True)
-table.add_column("Repo URL", style="green", no_wrap=True)
-table.add_column("Languages", style="yellow")
-table.add_column("Automated Security Fixes", style="red", no_wrap=True)
-
-# Open a CSV file to write the results
-csv_filename = output_dir / f"huntr_repositories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-with open(csv_filename, mode='w', newline='') as file:
-    writer = csv.writer(file)
-    writer.writerow(["Organization", "Repo", "Repo URL", "Languages", "Automated Security Fixes"])
+# Function to enrich a single repository with GitHub metadata, returns its table/CSV row
+# and whether (and at what size) it should be cloned
+def enrich_repo(organization, repo, repo_data=None):
+    repo_url = f"{github_api_base_url}/{organization}/{repo}"
+    languages = "N/A"
+    clone_size = None
+    clone_requested = False
 
-    print(MessageType.INFO, f"Instantiating GitHub API requests..\n")
-
-    for organization, repo in repos:
-        repo_url = f"{github_api_base_url}/{organization}/{repo}"
+    # Prefer the metadata from the GraphQL batch, fall back to the REST API for anything it missed
+    if repo_data is None:
         print_message(MessageType.INFO, f"Requesting URL: {repo_url}")
-        logging.info(f"Request Headers: {headers}")
-        
+        logging.debug("Request headers", extra={"payload": loggable_headers})
+
         repo_response = make_request_with_retry(repo_url, headers, "Failed to fetch repository details")
-        
-        if repo_response is None:
-            languages = "N/A"
-        elif repo_response.status_code == 200:
+
+        if repo_response is not None and repo_response.status_code == 200:
             repo_data = repo_response.json()
-            logging.info(f"Response JSON: {json.dumps(repo_data, indent=2)}")
-            
-            if 'organization' in repo_data:
-                org_info = repo_data['organization']
-                print_message(MessageType.SUCCESS, f"Repository: {repo}, Organization: {org_info['login']}")
-                
-                # Clone the repository
-                cloned = clone_repo(organization, repo)
-                
-                # Fetch languages
+            logging.debug("Response JSON", extra={"payload": repo_data})
+        elif repo_response is not None:
+            print_message(MessageType.FATAL, f"Failed to fetch details for repository: {repo}")
+            logging.error(f"Response Status Code: {repo_response.status_code}", extra={"printed": True})
+            logging.error(f"Response Text: {repo_response.text}", extra={"printed": True})
+
+    if repo_data is not None:
+        if 'organization' in repo_data:
+            org_info = repo_data['organization']
+            print_message(MessageType.SUCCESS, f"Repository: {repo}, Organization: {org_info['login']}")
+
+            # Pass the repository on to the clone stage
+            clone_size = repo_data.get('size')
+            clone_requested = True
+
+            # Languages come with the GraphQL metadata, otherwise fetch them
+            if 'languages' in repo_data:
+                languages = ", ".join(repo_data['languages'])
+            else:
                 languages_url = f"{repo_url}/languages"
                 languages_response = make_request_with_retry(languages_url, headers, "Failed to fetch languages")
-                
+
                 if languages_response and languages_response.status_code == 200:
                     languages_data = languages_response.json()
                     languages = ", ".join(languages_data.keys())
                 else:
                     languages = "Failed to fetch"
-            else:
-                languages = "N/A"
-                print_message(MessageType.WARN, f"Repository: {repo}, Organization: Not available")
         else:
-            languages = "N/A"
-            print_message(MessageType.FATAL, f"Failed to fetch details for repository: {repo}")
-            logging.error(f"Response Status Code: {repo_response.status_code}")
-            logging.error(f"Response Text: {repo_response.text}")
-
-        # Check for automated security fixes
-        security_fixes_url = f"{repo_url}/automated-security-fixes"
-        security_fixes_response = make_request_with_retry(security_fixes_url, headers, "Failed to fetch automated security fixes status")
-        
-        if security_fixes_response and security_fixes_response.status_code == 200:
-            security_fixes_data = security_fixes_response.json()
-            automated_security_fixes = "False" if security_fixes_data.get("enabled") == False else "True"
-        else:
-            automated_security_fixes = "Failed to fetch"
-
-        # Add the result to the table
-        table.add_row(organization, repo, repo_url, languages, automated_security_fixes)
-        
-        # Write the result to the CSV file
-        writer.writerow([organization, repo, repo_url, languages, automated_security_fixes])
+            print_message(MessageType.WARN, f"Repository: {repo}, Organization: Not available")
 
-# Print the table to the console
-CONSOLE.print(table)
+    # Check for automated security fixes
+    security_fixes_url = f"{repo_url}/automated-security-fixes"
+    security_fixes_response = make_request_with_retry(security_fixes_url, headers, "Failed to fetch automated security fixes status")
+    
+    if security_fixes_response and security_fixes_response.status_code == 200:
+        security_fixes_data = security_fixes_response.json()
+        automated_security_fixes = "False" if security_fixes_data.get("enabled") == False else "True"
+    else:
+        automated_security_fixes = "Failed to fetch"
+
+    row = [organization, repo, repo_url, languages, automated_security_fixes]
+    journal.record(ENRICHED, organization, repo, {"row": row, "clone": clone_requested, "size": clone_size})
+    return row, clone_requested, clone_size
+
+# Lock for the scrape stage's repositories already seen on an earlier page, and their (page, position)
+scraped_lock = threading.Lock()
+scrape_order = {}
+
+# Scrape stage: fetch one listing page and pass on the repositories not seen before
+def scrape_page(page):
+    new_repos = []
+    for organization, repo in fetch_listing_page(HUNTR_BOUNTIES_URL, page):
+        with scraped_lock:
+            if (organization, repo) in scrape_order:
+                continue
+            scrape_order[(organization, repo)] = (page, len(new_repos))
+        journal.record(SCRAPED, organization, repo)
+        print_message(MessageType.INFO, f"Organization: {organization}, Repo: {repo}")
+        new_repos.append((organization, repo))
+    return new_repos
+
+# Result files are sorted into scrape order once the run is done; repositories missing from
+# scrape_order (none should be) go last
+def scrape_position(cells):
+    return scrape_order.get((cells[0], cells[1]), (math.inf, 0))
+
+# GraphQL stage: look up a batch of repositories in one query, the enrich stage falls back to REST
+# for anything missing. Repositories a resumed run already enriched are not looked up again
+def fetch_metadata_batch(batch):
+    pending_repos = [item for item in batch if item not in journal.state.enriched]
+    graphql_metadata = fetch_repo_metadata(pending_repos, github, batch_size=len(batch)) if pending_repos else {}
+    return [(organization, repo, graphql_metadata.get((organization, repo))) for organization, repo in batch]
+
+# Enrich stage: enrich a repository, or replay its row from the journal when a resumed run already enriched it
+def enrich_or_resume(organization, repo, repo_data=None):
+    enriched = journal.state.enriched.get((organization, repo))
+    if enriched is None:
+        row, clone_requested, clone_size = enrich_repo(organization, repo, repo_data)
+        return row, clone_requested, clone_size, False
+
+    # Clones that had not finished when the previous run stopped are cloned again
+    clone_requested = enriched["clone"] and (organization, repo) not in journal.state.cloned
+    return enriched["row"], clone_requested, enriched["size"], True
+
+# Clone stage: clone the repository when the enrich stage asked for it, then hand the row to the output
+def clone_stage(item):
+    row, clone_requested, clone_size, resumed = item
+    organization, repo = row[0], row[1]
+    if clone_requested and args.skip_deferred and clone_pool.is_deferred(clone_requested, clone_size, args.defer_size):
+        print_message(MessageType.WARN, f"Skipped deferred clone ({clone_size / 1024:.1f} MB): {organization}/{repo}")
+        return row
+    if clone_requested:
+        if resumed and clone_pool.remove_partial_clone(clone_workers.path(organization, repo)):
+            print_message(MessageType.WARN, f"Removed partial clone: {clone_workers.path(organization, repo)}")
+        clone_workers.clone(organization, repo, clone_size)
+    return row
+
+# Record this run in the results store. A resumed run keeps writing to the run it started with
+run_id = journal.state.run.get("run_id")
+if run_id is None:
+    run_id = results_store.start_run("huntr-scraper")
+    journal.record(RUN_STARTED, data={"run_id": run_id})
+
+# scrape -> [graphql] -> enrich -> clone, each stage on its own workers with bounded queues in between.
+# A resumed run whose scrape completed starts from the journaled repositories instead of the listing
+stages = []
+if journal.state.scrape_complete:
+    source = list(journal.state.scraped)
+    print_message(MessageType.SUCCESS, f"Loaded {len(source)} programs from the journal\n")
+    # The journaled repositories are in scrape order
+    scrape_order.update({item: (0, position) for position, item in enumerate(source)})
+else:
+    print_message(MessageType.INFO, f"Scraping programs from {HUNTR_BOUNTIES_URL} ({args.pages} page(s), {HTML_PARSER} parser)..\n")
+    source = range(1, args.pages + 1)
+    stages.append(Stage("scrape", scrape_page, workers=min(args.scrape_workers, args.pages), fan_out=True,
+                        on_finish=lambda: journal.record(SCRAPE_COMPLETE)))
+if args.graphql:
+    print_message(MessageType.INFO, f"Fetching repository metadata through GraphQL in batches of {args.graphql_batch_size}..\n")
+    stages.append(Stage("graphql", fetch_metadata_batch, batch_size=args.graphql_batch_size, fan_out=True))
+stages.append(Stage("enrich", lambda item: enrich_or_resume(*item), workers=args.concurrency))
+# Largest repositories first, the ones over --defer-size once everything else is cloned
+stages.append(Stage("clone", clone_stage, workers=args.clone_workers,
+                    priority=lambda item: clone_pool.clone_priority(item[1], item[2]),
+                    defer=lambda item: clone_pool.is_deferred(item[1], item[2], args.defer_size)))
+repo_pipeline = Pipeline(stages, queue_size=args.queue_size)
+
+print_message(MessageType.INFO, f"Instantiating GitHub API requests ({args.concurrency} concurrent)..\n")
 
-# Save the table to a file
+csv_filename = output_dir / f"huntr_repositories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 table_filename = output_dir / f"huntr_repositories_table_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-with open(table_filename, 'w') as f:
-    table_text = CONSOLE.export_text()
-    f.write(table_text)
+print_message(MessageType.INFO, f"Writing results to {csv_filename} and {table_filename} ..\n")
+
+# Every row is flushed to the CSV and table files as it arrives and the files are sorted into scrape order
+# at the end; the console shows the latest --window rows
+results_table = StreamingTable(
+    CONSOLE,
+    [("Organization", {"style": "cyan", "no_wrap": True}),
+     ("Repo", {"style": "magenta", "no_wrap": True}),
+     ("Repo URL", {"style": "green", "no_wrap": True}),
+     ("Languages", {"style": "yellow"}),
+     ("Automated Security Fixes", {"style": "red", "no_wrap": True})],
+    csv_filename,
+    table_filename,
+    title="GitHub Repositories",
+    window=args.window,
+    sort_key=scrape_position,
+    box=box.MINIMAL_HEAVY_HEAD,
+    show_lines=True,
+    title_style="bold magenta",
+    header_style="bold cyan"
+)
+
+# Rows are written in completion order as they come out of the pipeline, on this thread
+with results_table:
+    for row in repo_pipeline.run(source):
+        # Add the result to the table and files
+        results_table.add_row(*row)
+
+        # Upsert the result into the results store
+        results_store.add_repo_result(run_id, *row)
+
+        # Clones seen in this run are the last to be evicted
+        clone_path = clone_workers.path(row[0], row[1])
+        if clone_path.exists():
+            repo_store.touch(f"{row[0]}/{row[1]}", clone_path)
+
+for stage_stats in repo_pipeline.stats():
+    logging.info(f"Pipeline stage {stage_stats['stage']}", extra={"payload": stage_stats})
+
+# Clone time of the run, and how many clones were held back for --defer-size
+clone_summary = clone_workers.summary()
+clone_summary["deferred"] = next(s["items_deferred"] for s in repo_pipeline.stats() if s["stage"] == "clone")
+logging.info("Clone summary", extra={"payload": clone_summary})
+if clone_summary["clones"]:
+    print_message(MessageType.INFO, f"{clone_summary['clones']} clones took {clone_summary['clone_seconds']:.0f}s in total "
+                                    f"on {args.clone_workers} workers, longest {clone_summary['longest']} "
+                                    f"({clone_summary['longest_seconds']:.0f}s), {clone_summary['deferred']} deferred\n")
+
+if args.disk_budget is not None:
+    evicted = repo_store.evict(int(args.disk_budget * 1024 ** 3))
+    print_message(MessageType.INFO, f"Evicted {len(evicted)} least recently used clones to stay within {args.disk_budget} GB\n")
+repo_store.save()
+
+if response_cache is not None:
+    print_message(MessageType.INFO, f"GitHub API cache: {response_cache.hits} responses served from disk\n")
+
+results_store.finish_run(run_id)
+
+# Report what changed since the previous run
+new_repos = results_store.new_repos_since_last_run(run_id)
+print_message(MessageType.INFO, f"{len(new_repos)} new repositories since the last run")
+for new_repo in new_repos:
+    print_message(MessageType.INFO, f"  New: {new_repo['organization']}/{new_repo['repo']}")
+results_store.close()
+
+journal.record(RUN_FINISHED)
+journal.close()
 
 print_message(MessageType.SUCCESS, f"CSV file saved: {csv_filename}\n")
-print_message(MessageType.SUCCESS, f"Table file saved: {table_filename}\n")
\ No newline at end of file
+print_message(MessageType.SUCCESS, f"Table file saved: {table_filename}\n")
+print_message(MessageType.SUCCESS, f"Results store: {db_path} (run {run_id})\n")
\ No newline at end of file
@@ -0,0 +1,89 @@
+import logging
+import threading
+from urllib.parse import unquote
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+import http_cassette
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+HUNTR_BOUNTIES_URL = "https://huntr.com/bounties"
+
+# Bounty cards are the only part of the listing the scrapers read
+BOUNTY_CARD_CLASS = "group flex flex-row"
+BOUNTY_CARD_STRAINER = SoupStrainer("div", class_=BOUNTY_CARD_CLASS)
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+# Extract the (organization, repo) pair from one bounty card, or None when the card lacks either
+def parse_bounty_card(item):
+    organization = repo = None
+
+    # Extract organization from img tag
+    img_tag = item.find('img', alt='Repo')
+    if img_tag and img_tag.get('src'):
+        decoded_url = unquote(img_tag['src'])
+        organization = decoded_url.split('/')[-1].split('.')[0]
+
+    # Extract repo from span tag
+    span_tag = item.find('span')
+    if span_tag:
+        repo = span_tag.text.strip()
+
+    if organization and repo:
+        return organization, repo
+    return None
+
+
+# Parse only the bounty cards out of a listing page. The strainer keeps BeautifulSoup from
+# materializing the rest of the document, and lxml is used when it is installed.
+@instrumentation.timed("parse_listing")
+def parse_bounty_cards(html, parser=HTML_PARSER):
+    soup = BeautifulSoup(html, parser, parse_only=BOUNTY_CARD_STRAINER)
+    repos = []
+    for item in soup.find_all('div', class_=BOUNTY_CARD_CLASS):
+        parsed = parse_bounty_card(item)
+        if parsed:
+            repos.append(parsed)
+    return repos
+
+
+def page_url(url, page):
+    return url if page == 1 else f"{url}?page={page}"
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Session shared by listing fetches that don't bring their own, with the HTTP cassette when one is configured
+def default_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            http_cassette.install_from_env(_session)
+        return _session
+
+
+def fetch_page(url, session=None, timeout=30):
+    response = instrumentation.request(session or default_session(), "GET", url, timeout=timeout)
+    response.raise_for_status()
+    return parse_bounty_cards(response.content)
+
+
+# Fetch and parse one listing page; a page that fails to load is logged and yields no repos
+def fetch_listing_page(url=HUNTR_BOUNTIES_URL, page=1, session=None):
+    try:
+        return fetch_page(page_url(url, page), session=session)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to fetch bounty listing {page_url(url, page)}: {e}")
+        return []
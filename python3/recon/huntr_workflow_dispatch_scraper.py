@@ -1,26 +1,101 @@
 from enum import Enum
 from rich.console import Console
 from rich.style import Style
-from rich.table import Table, box
-from rich.logging import RichHandler
+from rich.table import box
 
-import requests
 from requests.exceptions import RequestException, ConnectionError, Timeout
-import time
 
-from bs4 import BeautifulSoup
+import math
 import os
 import sys
-import json
-from pprint import pprint
-from urllib.parse import unquote
-import csv
 import logging
 from datetime import datetime
-import subprocess
-from subprocess import TimeoutExpired
 from pathlib import Path
-import shlex
+import argparse
+
+from github_client import GitHubClient
+from github_graphql import DEFAULT_BATCH_SIZE, fetch_repo_metadata
+from huntr_listing import HUNTR_BOUNTIES_URL, HTML_PARSER, fetch_listing_page
+import clone_pool
+from recon_logging import setup_logging
+import instrumentation
+from results_store import ResultsStore
+from repo_store import RepoStore
+from stream_output import StreamingTable, DEFAULT_WINDOW
+import repo_scanner
+from scan_index import ScanIndex, CACHED, INCREMENTAL, FULL
+import bare_workflows
+import workflow_analyzer
+from pipeline import Pipeline, Stage, DEFAULT_QUEUE_SIZE
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Scrape huntr.com bounty programs and search their workflows for pull_request_target")
+parser.add_argument("--concurrency", "-c", type=int, default=8,
+                    help="Number of repositories to enrich in parallel (default: 8)")
+parser.add_argument("--graphql", action="store_true",
+                    help="Fetch repository details and languages through batched GraphQL queries, falling back to REST")
+parser.add_argument("--graphql-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                    help=f"Repositories per GraphQL query (default: {DEFAULT_BATCH_SIZE})")
+parser.add_argument("--clone-workers", type=int, default=4,
+                    help="Number of repositories to clone in parallel (default: 4)")
+parser.add_argument("--clone-depth", type=int, default=1,
+                    help="History depth for clones, 0 clones the full history (default: 1)")
+parser.add_argument("--blobless", action="store_true",
+                    help="Clone with --filter=blob:none, most useful together with --clone-depth 0")
+parser.add_argument("--clone-timeout", type=int, default=clone_pool.DEFAULT_BASE_TIMEOUT,
+                    help=f"Base clone timeout in seconds, extended by repo size (default: {clone_pool.DEFAULT_BASE_TIMEOUT})")
+parser.add_argument("--defer-size", type=float, default=clone_pool.DEFAULT_DEFER_SIZE_MB,
+                    help="Clone repositories bigger than this many MB after all the others, 0 never defers "
+                         f"(default: {clone_pool.DEFAULT_DEFER_SIZE_MB})")
+parser.add_argument("--skip-deferred", action="store_true",
+                    help="Leave the repositories over --defer-size out of this run instead of cloning them last")
+parser.add_argument("--workflows-only", action="store_true",
+                    help="Sparse, blobless clones that only fetch .github/workflows/ and scan just that directory")
+parser.add_argument("--bare-mirrors", action="store_true",
+                    help="Keep blobless bare mirrors and read .github/workflows/ straight from git objects, "
+                         "caching scan results by blob SHA")
+parser.add_argument("--grep", action="store_true",
+                    help="Report every line mentioning pull_request_target instead of parsing the workflows "
+                         "for risky trigger, checkout and run step combinations")
+parser.add_argument("--scan-workers", type=int, default=os.cpu_count(),
+                    help="Number of processes scanning cloned repositories (default: CPU count)")
+parser.add_argument("--full-rescan", action="store_true",
+                    help="Ignore the scan index and rescan every repository from scratch")
+parser.add_argument("--pages", type=int, default=1,
+                    help="Number of bounty listing pages to fetch in parallel (default: 1)")
+parser.add_argument("--scrape-workers", type=int, default=4,
+                    help="Number of bounty listing pages fetched at once (default: 4)")
+parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                    help=f"Repositories buffered between pipeline stages (default: {DEFAULT_QUEUE_SIZE})")
+parser.add_argument("--shared-objects", action="store_true",
+                    help="Store objects shared between clones (forks, mirrors) once, in a reference repository")
+parser.add_argument("--disk-budget", type=float,
+                    help="Evict the least recently scanned clones once they take more than this many GB")
+parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                    help=f"Rows shown in the live results table, every row goes to the CSV and table files (default: {DEFAULT_WINDOW})")
+parser.add_argument("--metrics", type=Path,
+                    help="Write span, counter and histogram totals here at exit, Prometheus text for .prom files, "
+                         "JSON otherwise (default: $RECON_METRICS)")
+parser.add_argument("--trace", type=Path,
+                    help="Append every timed span (HTTP request, git command, parse, file write) to this JSONL file")
+parser.add_argument("--profile", type=Path,
+                    help="Profile every thread with cProfile and write the stats here at exit")
+parser.add_argument("--log-level", default="DEBUG", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                    help="Minimum level written to the JSONL log file (default: DEBUG)")
+args = parser.parse_args()
+if args.shared_objects and (args.blobless or args.workflows_only or args.bare_mirrors or args.clone_depth != 0):
+    parser.error("--shared-objects needs full clones with full history: --clone-depth 0 and no --blobless, "
+                 "--workflows-only or --bare-mirrors")
+
+# Patterns searched for in every cloned repository with --grep
+SEARCH_PATTERNS = ["pull_request_target"]
+# What the scan caches key their results on: the grep patterns, or the analyzer version
+SCAN_PATTERNS = SEARCH_PATTERNS if args.grep else [workflow_analyzer.ANALYZER_ID]
+FINDINGS = "'pull_request_target_trigger'" if args.grep else "workflow risk"
 
 # Setup base directories
 home_dir = Path.home()
@@ -28,23 +103,30 @@ base_dir = home_dir / "git" / "bounties"
 log_dir = base_dir / "logs"
 output_dir = base_dir / "output"
 repos_dir = base_dir / "repositories"
+mirrors_dir = base_dir / "mirrors"
+state_dir = base_dir / "state"
+db_path = base_dir / "results.db"
 
 # Create necessary directories
-for directory in [log_dir, output_dir, repos_dir]:
+for directory in [log_dir, output_dir, repos_dir, mirrors_dir]:
     directory.mkdir(parents=True, exist_ok=True)
 
-# Setup logging
-log_filename = log_dir / f"log_output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        RichHandler(),
-        logging.FileHandler(str(log_filename))
-    ]
-)
+# Scans and workflow parsing run in forked processes; start them all now, before the logging listener
+# and any other thread exists, so no child inherits a lock held by a thread that isn't there.
+# Grepping mirrors is git I/O and stays on the scan threads
+scan_executor = None
+if not (args.bare_mirrors and args.grep):
+    scan_executor = ProcessPoolExecutor(max_workers=args.scan_workers, mp_context=multiprocessing.get_context("fork"))
+    scan_executor.submit(int).result()
+
+# Setup logging, formatting and file I/O happen on a background listener thread
+log_filename = setup_logging(log_dir, level=getattr(logging, args.log_level))
+
+# Time HTTP requests, git commands, parsing and file writes; exported at exit
+instrumentation.install_from_env(metrics=args.metrics, trace=args.trace, profile=args.profile)
 
-CONSOLE = Console(record=True)
+# Nothing is recorded: results are streamed to their files as they are produced
+CONSOLE = Console()
 
 # Define the message types
 class MessageType(Enum):
@@ -69,75 +151,71 @@ emojis = {
     MessageType.INFO: ":information_source:",  # ℹ️
 }
 
+# Log levels for print_message records in the log file
+log_levels = {
+    MessageType.SUCCESS: logging.INFO,
+    MessageType.WARN: logging.WARNING,
+    MessageType.FATAL: logging.ERROR,
+    MessageType.INFO: logging.INFO,
+}
+
 # Function to print messages with styles and emojis
 def print_message(message_type, message):
     style = styles.get(message_type, Style())
     emoji = emojis.get(message_type, "")
     CONSOLE.print(f"{emoji} {message}", style=style)
-    logging.info(f"{emoji} {message}")
+    # Already on the console, so this record only goes to the log file
+    logging.log(log_levels.get(message_type, logging.INFO), message.strip(), extra={"printed": True})
 
 print_message(MessageType.SUCCESS, f"Instantiated logging: {log_filename}\n")
 
-# Function to clone repositories
-def clone_repo(org, repo):
-    repo_path = repos_dir / org / repo
-    
-    if repo_path.exists():
-        print_message(MessageType.WARN, f"Directory already exists: {repo_path}")
-        return False
-    
-    repo_path.parent.mkdir(parents=True, exist_ok=True)
-    clone_url = f"https://github.com/{org}/{repo}.git"
-    
-    try:
-        subprocess.run(["git", "clone", clone_url, str(repo_path)], 
-                       check=True, capture_output=True, text=True, timeout=30)
-        print_message(MessageType.SUCCESS, f"Cloned repository: {clone_url} to {repo_path}")
-        return True
-    except TimeoutExpired:
-        print_message(MessageType.FATAL, f"Cloning repository timed out after 30 seconds: {clone_url}")
-        logging.error(f"Git clone timeout: {clone_url}")
-        # Clean up the partially cloned repository
-        if repo_path.exists():
-            subprocess.run(["rm", "-rf", str(repo_path)])
-        return False
-    except subprocess.CalledProcessError as e:
+# SQLite store of every run's results
+results_store = ResultsStore(db_path)
+
+# Clones on disk: shared reference objects and last-scan times for --disk-budget eviction
+repo_store = RepoStore(state_dir / ("mirror_store.json" if args.bare_mirrors else "repo_store.json"),
+                       reference=base_dir / "objects.git" if args.shared_objects else None)
+
+# Function to report finished clones, called from the clone stage workers
+def report_clone(result):
+    clone_url = f"https://github.com/{result.org}/{result.repo}.git"
+    if result.status in (clone_pool.CLONED, clone_pool.EXISTS):
+        repo_store.add_clone(f"{result.org}/{result.repo}", result.path, result.status == clone_pool.CLONED)
+    if result.status == clone_pool.EXISTS:
+        print_message(MessageType.WARN, f"Directory already exists: {result.path}")
+    elif result.status == clone_pool.UPDATED:
+        print_message(MessageType.SUCCESS, f"Updated mirror: {result.path} in {result.elapsed:.1f}s")
+    elif result.status == clone_pool.CLONED:
+        print_message(MessageType.SUCCESS, f"Cloned repository: {clone_url} to {result.path} in {result.elapsed:.1f}s")
+    elif result.status == clone_pool.TIMEOUT:
+        print_message(MessageType.FATAL, f"Cloning repository timed out after {result.timeout:.0f} seconds: {clone_url}")
+        logging.error(f"Git clone timeout: {clone_url}", extra={"printed": True})
+    else:
         print_message(MessageType.FATAL, f"Failed to clone repository: {clone_url}")
-        logging.error(f"Git clone error: {e.stderr}")
-        return False
-
-# Function for retrying requests
-def make_request_with_retry(url, headers, error_message, max_retries=3, backoff_factor=0.3):
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response
-        except (ConnectionError, Timeout) as e:
-            if attempt == max_retries - 1:
-                print_message(MessageType.FATAL, f"{error_message}: {url}")
-                logging.error(f"Connection error: {str(e)}")
-                return None
-            time.sleep(backoff_factor * (2 ** attempt))
-        except RequestException as e:
-            print_message(MessageType.FATAL, f"{error_message}: {url}")
-            logging.error(f"Request error: {str(e)}")
-            return None
-
-# Function to search for pull_request_target_trigger in a repository
-def search_repo(repo_path, search_string):
+        logging.error(f"Git clone error: {result.error}", extra={"printed": True})
+
+# Clone settings for the clone stage: shallow and/or blobless, with timeouts scaled to repo size.
+# --workflows-only restricts the checkout to the workflow directory, --bare-mirrors skips the checkout entirely
+clone_workers = clone_pool.ClonePool(mirrors_dir if args.bare_mirrors else repos_dir, workers=args.clone_workers,
+                                     depth=args.clone_depth, blobless=args.blobless, base_timeout=args.clone_timeout,
+                                     callback=report_clone,
+                                     sparse_paths=clone_pool.WORKFLOW_SPARSE_PATHS if args.workflows_only else None,
+                                     bare=args.bare_mirrors, reference=repo_store.reference)
+
+# Function for GitHub API requests. Retries, rate limits and caching are handled by the shared GitHub client
+def make_request_with_retry(url, headers, error_message):
     try:
-        cmd = f"grep -r -n '{search_string}' {repo_path}"
-        result = subprocess.run(shlex.split(cmd), capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            matches = result.stdout.strip().split('\n')
-            return [f"{match}" for match in matches]
-        else:
-            return []
-    except subprocess.CalledProcessError as e:
-        print_message(MessageType.WARN, f"Error searching repository {repo_path}: {str(e)}")
-        return []
+        response = github.get(url, headers=headers)
+        response.raise_for_status()
+        return response
+    except (ConnectionError, Timeout) as e:
+        print_message(MessageType.FATAL, f"{error_message}: {url}")
+        logging.error(f"Connection error: {str(e)}", extra={"printed": True})
+        return None
+    except RequestException as e:
+        print_message(MessageType.FATAL, f"{error_message}: {url}")
+        logging.error(f"Request error: {str(e)}", extra={"printed": True})
+        return None
 
 # Check if the GitHub token is set
 github_token = os.getenv('GITHUB_TOKEN')
@@ -145,38 +223,8 @@ if not github_token:
     print_message(MessageType.FATAL, "Error: GITHUB_TOKEN environment variable is not set.")
     sys.exit(1)
 
-print_message(MessageType.INFO, f"Scraping programs from https://huntr.com/bounties..\n")
-
-# Make a GET request to the URL
-url = 'https://huntr.com/bounties'
-response = requests.get(url)
-
-# Parse the HTML content using BeautifulSoup
-soup = BeautifulSoup(response.content, 'html.parser')
-
-print_message(MessageType.INFO, f"Parsing program info..\n")
-
-# Find all bounty items
-bounty_items = soup.find_all('div', class_='group flex flex-row')
-
-# Extract and print the organization and repo information
-repos = []
-for item in bounty_items:
-    # Extract organization from img tag
-    img_tag = item.find('img', alt='Repo')
-    if img_tag:
-        src_url = img_tag['src']
-        decoded_url = unquote(src_url)
-        organization = decoded_url.split('/')[-1].split('.')[0]
-    
-    # Extract repo from span tag
-    span_tag = item.find('span')
-    if span_tag:
-        repo = span_tag.text.strip()
-    
-    if organization and repo:
-        print_message(MessageType.INFO, f"Organization: {organization}, Repo: {repo}")
-        repos.append((organization, repo))
+# Pooled GitHub API session with an adaptive rate-limit governor
+github = GitHubClient(github_token, pool_size=args.concurrency)
 
 # GitHub API base URL
 github_api_base_url = 'https://api.github.com/repos'
@@ -188,117 +236,279 @@ headers = {
     'X-GitHub-Api-Version': '2022-11-28'
 }
 
-print_message(MessageType.INFO, f"Writing results to CSV and console..\n")
+# Headers as they may appear in the log file, without the token
+loggable_headers = {k: v for k, v in headers.items() if k != 'Authorization'}
+
+# Lock for the scrape stage's repositories already seen on an earlier page, and their (page, position)
+scraped_lock = threading.Lock()
+scrape_order = {}
+
+# Scrape stage: fetch one listing page and pass on the repositories not seen before
+def scrape_page(page):
+    new_repos = []
+    for organization, repo in fetch_listing_page(HUNTR_BOUNTIES_URL, page):
+        with scraped_lock:
+            if (organization, repo) in scrape_order:
+                continue
+            scrape_order[(organization, repo)] = (page, len(new_repos))
+        print_message(MessageType.INFO, f"Organization: {organization}, Repo: {repo}")
+        new_repos.append((organization, repo))
+    return new_repos
+
+# Result files are sorted into scrape order once the run is done; repositories missing from
+# scrape_order (none should be) go last
+def scrape_position(cells):
+    return scrape_order.get((cells[0], cells[1]), (math.inf, 0))
+
+# GraphQL stage: look up a batch of repositories in one query, the enrich stage falls back to REST
+# for anything missing
+def fetch_metadata_batch(batch):
+    graphql_metadata = fetch_repo_metadata(batch, github, batch_size=len(batch))
+    return [(organization, repo, graphql_metadata.get((organization, repo))) for organization, repo in batch]
+
+# Enrich stage: fetch the repository details and languages, returns its row and whether to clone it
+def enrich_repo(organization, repo, repo_data=None):
+    repo_url = f"{github_api_base_url}/{organization}/{repo}"
+    languages = "N/A"
+    clone_size = None
+    clone_requested = False
+
+    # Prefer the metadata from the GraphQL batch, fall back to the REST API for anything it missed
+    if repo_data is None:
+        print_message(MessageType.INFO, f"Requesting URL: {repo_url}")
+        logging.debug("Request headers", extra={"payload": loggable_headers})
 
-# Create a table for console output
-# Create a table for console output
-table = Table(
-    title="GitHub Repositories",
-    box=box.MINIMAL_HEAVY_HEAD,
-    show_lines=True,
-    title_style="bold magenta",
-    header_style="bold cyan"
-)
-table = Table(title="GitHub Repositories", box=box.ROUNDED)
-table.add_column("Organization", justify="left", style="cyan", no_wrap=True)
-table.add_column("Repo", justify="left", style="magenta", no_wrap=True)
-table.add_column("Repo URL", justify="left", style="green", width=40, overflow="fold")
-table.add_column("Languages", justify="left", style="yellow", width=40, overflow="fold")
+        repo_response = make_request_with_retry(repo_url, headers, "Failed to fetch repository details")
 
-csv_filename = output_dir / f"huntr_repositories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-with open(csv_filename, mode='w', newline='') as file:
-    writer = csv.writer(file)
-    writer.writerow(["Organization", "Repo", "Repo URL", "Languages"])
+        if repo_response is not None and repo_response.status_code == 200:
+            repo_data = repo_response.json()
+            logging.debug("Response JSON", extra={"payload": repo_data})
+        elif repo_response is not None:
+            print_message(MessageType.FATAL, f"Failed to fetch details for repository: {repo}")
+            logging.error(f"Response Status Code: {repo_response.status_code}", extra={"printed": True})
+            logging.error(f"Response Text: {repo_response.text}", extra={"printed": True})
 
-    print_message(MessageType.INFO, f"Instantiating GitHub API requests..\n")
+    if repo_data is not None:
+        if 'organization' in repo_data:
+            org_info = repo_data['organization']
+            print_message(MessageType.SUCCESS, f"Repository: {repo}, Organization: {org_info['login']}")
 
-    for organization, repo in repos:
-        repo_url = f"{github_api_base_url}/{organization}/{repo}"
-        print_message(MessageType.INFO, f"Requesting URL: {repo_url}")
-        logging.info(f"Request Headers: {headers}")
-        
-        repo_response = make_request_with_retry(repo_url, headers, "Failed to fetch repository details")
-        
-        if repo_response is None:
-            languages = "N/A"
-        elif repo_response.status_code == 200:
-            repo_data = repo_response.json()
-            logging.info(f"Response JSON: {json.dumps(repo_data, indent=2)}")
-            
-            if 'organization' in repo_data:
-                org_info = repo_data['organization']
-                print_message(MessageType.SUCCESS, f"Repository: {repo}, Organization: {org_info['login']}")
-                
-                # Clone the repository
-                cloned = clone_repo(organization, repo)
-                
-                # Fetch languages
+            # Pass the repository on to the clone stage
+            clone_size = repo_data.get('size')
+            clone_requested = True
+
+            # Languages come with the GraphQL metadata, otherwise fetch them
+            if 'languages' in repo_data:
+                languages = ", ".join(repo_data['languages'])
+            else:
                 languages_url = f"{repo_url}/languages"
                 languages_response = make_request_with_retry(languages_url, headers, "Failed to fetch languages")
-                
+
                 if languages_response and languages_response.status_code == 200:
                     languages_data = languages_response.json()
                     languages = ", ".join(languages_data.keys())
                 else:
                     languages = "Failed to fetch"
-            else:
-                languages = "N/A"
-                print_message(MessageType.WARN, f"Repository: {repo}, Organization: Not available")
         else:
-            languages = "N/A"
-            print_message(MessageType.FATAL, f"Failed to fetch details for repository: {repo}")
-            logging.error(f"Response Status Code: {repo_response.status_code}")
-            logging.error(f"Response Text: {repo_response.text}")
-        
-        # Add the result to the table
-        table.add_row(organization, repo, repo_url, languages)
-        
-        # Write the result to the CSV file
-        writer.writerow([organization, repo, repo_url, languages])
-
-# Print the table to the console
-CONSOLE.print(table)
-
-# Save the table to a file
-table_filename = output_dir / f"huntr_repositories_table_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-with open(table_filename, 'w') as f:
-    table_text = CONSOLE.export_text()
-    f.write(table_text)
+            print_message(MessageType.WARN, f"Repository: {repo}, Organization: Not available")
+
+    return [organization, repo, repo_url, languages], clone_requested, clone_size
+
+# Clone stage: clone (or update the mirror of) the repository when the enrich stage asked for it
+def clone_stage(item):
+    row, clone_requested, clone_size = item
+    if clone_requested and args.skip_deferred and clone_pool.is_deferred(clone_requested, clone_size, args.defer_size):
+        print_message(MessageType.WARN, f"Skipped deferred clone ({clone_size / 1024:.1f} MB): {row[0]}/{row[1]}")
+        return row
+    if clone_requested:
+        clone_workers.clone(row[0], row[1], clone_size)
+    return row
+
+if args.bare_mirrors:
+    # Scan results of every workflow blob seen so far
+    blob_cache = bare_workflows.BlobScanCache(state_dir / "workflow_blob_cache.json")
+    blob_cache.use_patterns(SCAN_PATTERNS)
+    if args.full_rescan:
+        blob_cache.clear()
+else:
+    # Last scanned HEAD and matches of every repository
+    scan_index = ScanIndex(state_dir / "scan_index.json")
 
-# Additional step: Search for pull_request_target in cloned repositories
-print_message(MessageType.INFO, "Searching for 'pull_request_target' in cloned repositories...")
-workflow_matches = {}
+# Parse one workflow blob on the process pool, skipping the round trip for blobs no rule can match
+def analyze_blob(data):
+    if not workflow_analyzer.might_match(data):
+        return []
+    # Spans inside the pool processes are not collected, time the round trip here
+    with instrumentation.span("scan_process", engine="analyze_blob"):
+        return scan_executor.submit(workflow_analyzer.analyze_workflow, data).result()
+
+# Scan stage: analyze the repository's workflows (or grep it for SEARCH_PATTERNS), returns its row with
+# the matches and scan mode, or no matches when it was not cloned
+def scan_stage(row):
+    organization, repo = row[0], row[1]
+    repo_key = f"{organization}/{repo}"
+
+    if args.bare_mirrors:
+        # List the workflow files from the tree and read only unseen blobs through git cat-file --batch
+        git_dir = clone_workers.path(organization, repo)
+        if not git_dir.exists():
+            return row, None, None
+        analyze = None if args.grep else analyze_blob
+        return row, bare_workflows.scan_mirror(git_dir, SEARCH_PATTERNS, blob_cache, analyze=analyze), "mirror"
 
-for organization, repo in repos:
     repo_path = repos_dir / organization / repo
-    if repo_path.exists():
-        matches = search_repo(repo_path, "pull_request_target")
-        if matches:
-            workflow_matches[f"{organization}/{repo}"] = matches
-
-# Print and log the pull_request_target_trigger matches
-if workflow_matches:
-    print_message(MessageType.SUCCESS, "Found 'pull_request_target_trigger' in the following repositories:")
-    for repo, matches in workflow_matches.items():
-        print_message(MessageType.INFO, f"Repository: {repo}")
-        for match in matches:
-            print_message(MessageType.INFO, f"  {match}")
-        logging.info(f"pull_request_target_trigger matches in {repo}:\n" + "\n".join(matches))
-else:
-    print_message(MessageType.INFO, "No 'pull_request_target_trigger' found in any repository.")
+    scan_root = repo_path
+    # Sparse clones only contain the workflow directory, so there is nothing else to walk
+    if args.workflows_only:
+        scan_root = repo_path / ".github" / "workflows"
+    if not scan_root.exists():
+        return row, None, None
+
+    # Only rescan repositories whose HEAD moved since the last run, and only their changed files.
+    # Each scan is one in-process pass for every pattern, on the process pool
+    mode, head, files = scan_index.plan(repo_key, repo_path, scan_root, SCAN_PATTERNS, full_rescan=args.full_rescan)
+    new_matches = []
+    if mode == CACHED:
+        pass
+    elif args.grep:
+        with instrumentation.span("scan_process", engine="grep"):
+            new_matches = scan_executor.submit(repo_scanner.scan_repo, str(scan_root), SEARCH_PATTERNS, files).result()
+    else:
+        with instrumentation.span("scan_process", engine="analyze_repo"):
+            new_matches = scan_executor.submit(workflow_analyzer.analyze_repo, str(scan_root), files).result()
+    return row, scan_index.record(repo_key, scan_root, mode, head, SCAN_PATTERNS, new_matches, files), mode
+
+# Record this run in the results store
+run_id = results_store.start_run("huntr_workflow_dispatch_scraper")
+
+# scrape -> [graphql] -> enrich -> clone -> scan, each stage on its own workers with bounded queues in between
+print_message(MessageType.INFO, f"Scraping programs from {HUNTR_BOUNTIES_URL} ({args.pages} page(s), {HTML_PARSER} parser)..\n")
+stages = [Stage("scrape", scrape_page, workers=min(args.scrape_workers, args.pages), fan_out=True)]
+if args.graphql:
+    print_message(MessageType.INFO, f"Fetching repository metadata through GraphQL in batches of {args.graphql_batch_size}..\n")
+    stages.append(Stage("graphql", fetch_metadata_batch, batch_size=args.graphql_batch_size, fan_out=True))
+stages.append(Stage("enrich", lambda item: enrich_repo(*item), workers=args.concurrency))
+# Largest repositories first, the ones over --defer-size once everything else is cloned
+stages.append(Stage("clone", clone_stage, workers=args.clone_workers,
+                    priority=lambda item: clone_pool.clone_priority(item[1], item[2]),
+                    defer=lambda item: clone_pool.is_deferred(item[1], item[2], args.defer_size)))
+stages.append(Stage("scan", scan_stage, workers=args.scan_workers))
+repo_pipeline = Pipeline(stages, queue_size=args.queue_size)
+
+print_message(MessageType.INFO, f"Instantiating GitHub API requests ({args.concurrency} concurrent)..\n")
 
-# Save pull_request_target_trigger matches to a file
+csv_filename = output_dir / f"huntr_repositories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+table_filename = output_dir / f"huntr_repositories_table_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
 workflow_matches_filename = output_dir / f"pull_request_target_trigger_matches_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-with open(workflow_matches_filename, 'w') as f:
-    if workflow_matches:
-        for repo, matches in workflow_matches.items():
-            f.write(f"Repository: {repo}\n")
-            for match in matches:
-                f.write(f"  {match}\n")
-            f.write("\n")
-    else:
-        f.write("No 'pull_request_target_trigger' found in any repository.\n")
+print_message(MessageType.INFO, f"Writing results to {csv_filename} and {table_filename} ..\n")
+
+# Every row is flushed to the CSV and table files as it arrives and the files are sorted into scrape order
+# at the end; the console shows the latest --window rows
+results_table = StreamingTable(
+    CONSOLE,
+    [("Organization", {"justify": "left", "style": "cyan", "no_wrap": True}),
+     ("Repo", {"justify": "left", "style": "magenta", "no_wrap": True}),
+     ("Repo URL", {"justify": "left", "style": "green", "width": 40, "overflow": "fold"}),
+     ("Languages", {"justify": "left", "style": "yellow", "width": 40, "overflow": "fold"})],
+    csv_filename,
+    table_filename,
+    title="GitHub Repositories",
+    window=args.window,
+    sort_key=scrape_position,
+    box=box.ROUNDED
+)
+
+# Additional step: Search for pull_request_target in cloned repositories, as they come out of the clone stage
+if args.grep:
+    print_message(MessageType.INFO, "Searching for 'pull_request_target' in cloned repositories...")
+else:
+    print_message(MessageType.INFO, f"Analyzing workflows in cloned repositories ({workflow_analyzer.Loader.__name__})...")
+repos_with_matches = 0
+scan_modes = Counter()
+
+# Rows are written in completion order as they come out of the pipeline, on this thread. Matches are
+# printed and written as they are found
+with results_table, open(workflow_matches_filename, 'w') as matches_file:
+    for row, matches, mode in repo_pipeline.run(range(1, args.pages + 1)):
+        organization, repo = row[0], row[1]
+
+        # Add the result to the table and files
+        results_table.add_row(*row)
+
+        # Upsert the result into the results store
+        results_store.add_repo_result(run_id, *row)
+
+        if matches is None:
+            continue
+        repo_store.touch(f"{organization}/{repo}", clone_workers.path(organization, repo))
+        scan_modes[mode] += 1
+        results_store.add_workflow_matches(run_id, organization, repo, matches)
+        if not matches:
+            continue
+
+        # Print, log and save the matches
+        repos_with_matches += 1
+        formatted_matches = [repo_scanner.format_match(match) for match in matches]
+        print_message(MessageType.SUCCESS, f"Found {FINDINGS} in repository: {organization}/{repo}")
+        for match in formatted_matches:
+            print_message(MessageType.INFO, f"  {match}")
+        logging.debug(f"{FINDINGS} matches in {organization}/{repo}", extra={"payload": formatted_matches})
+
+        matches_file.write(f"Repository: {organization}/{repo}\n")
+        for match in formatted_matches:
+            matches_file.write(f"  {match}\n")
+        matches_file.write("\n")
+        matches_file.flush()
+
+    if not repos_with_matches:
+        print_message(MessageType.INFO, f"No {FINDINGS} found in any repository.")
+        matches_file.write(f"No {FINDINGS} found in any repository.\n")
+
+for stage_stats in repo_pipeline.stats():
+    logging.info(f"Pipeline stage {stage_stats['stage']}", extra={"payload": stage_stats})
+
+# Clone time of the run, and how many clones were held back for --defer-size
+clone_summary = clone_workers.summary()
+clone_summary["deferred"] = next(s["items_deferred"] for s in repo_pipeline.stats() if s["stage"] == "clone")
+logging.info("Clone summary", extra={"payload": clone_summary})
+if clone_summary["clones"]:
+    print_message(MessageType.INFO, f"{clone_summary['clones']} clones took {clone_summary['clone_seconds']:.0f}s in total "
+                                    f"on {args.clone_workers} workers, longest {clone_summary['longest']} "
+                                    f"({clone_summary['longest_seconds']:.0f}s), {clone_summary['deferred']} deferred\n")
+
+if scan_executor is not None:
+    scan_executor.shutdown()
+if args.bare_mirrors:
+    blob_cache.save()
+    print_message(MessageType.INFO, f"Scanned {scan_modes['mirror']} mirrors: {blob_cache.hits} workflow files unchanged, "
+                                    f"{blob_cache.misses} read\n")
+else:
+    scan_index.save()
+    print_message(MessageType.INFO, f"Scanned {sum(scan_modes.values())} repositories: {scan_modes[CACHED]} unchanged, "
+                                    f"{scan_modes[INCREMENTAL]} incremental, {scan_modes[FULL]} full\n")
+print_message(MessageType.INFO, f"{repos_with_matches} repositories with {FINDINGS} matches\n")
+
+if args.disk_budget is not None:
+    evicted = repo_store.evict(int(args.disk_budget * 1024 ** 3))
+    print_message(MessageType.INFO, f"Evicted {len(evicted)} least recently scanned clones to stay within {args.disk_budget} GB\n")
+repo_store.save()
+
+results_store.finish_run(run_id)
+
+# Report what changed since the previous run
+new_repos = results_store.new_repos_since_last_run(run_id)
+print_message(MessageType.INFO, f"{len(new_repos)} new repositories since the last run")
+for new_repo in new_repos:
+    print_message(MessageType.INFO, f"  New: {new_repo['organization']}/{new_repo['repo']}")
+
+status_changes = results_store.pull_request_target_changes(run_id)
+print_message(MessageType.INFO, f"{len(status_changes)} repositories changed pull_request_target status since the last run")
+for change in status_changes:
+    print_message(MessageType.WARN, f"  {change['organization']}/{change['repo']}: "
+                                    f"{bool(change['previous'])} -> {bool(change['current'])}")
+results_store.close()
 
 print_message(MessageType.SUCCESS, f"pull_request_target trigger matches saved to {workflow_matches_filename}\n")
 print_message(MessageType.SUCCESS, f"CSV file saved: {csv_filename}\n")
-print_message(MessageType.SUCCESS, f"Table file saved: {table_filename}\n")
\ No newline at end of file
+print_message(MessageType.SUCCESS, f"Table file saved: {table_filename}\n")
+print_message(MessageType.SUCCESS, f"Results store: {db_path} (run {run_id})\n")
\ No newline at end of file
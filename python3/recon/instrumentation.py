@@ -0,0 +1,342 @@
+import atexit
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import subprocess
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Write a metrics summary here at exit: Prometheus text when the name ends in .prom, JSON otherwise
+METRICS_ENV = "RECON_METRICS"
+# Append every finished span to this .jsonl file
+TRACE_ENV = "RECON_TRACE"
+# Profile every thread with cProfile and dump the combined stats here at exit (python -m pstats <file>)
+PROFILE_ENV = "RECON_PROFILE"
+
+# Histogram bucket upper bounds in seconds, from a fast cache hit to a slow clone
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+PROMETHEUS_PREFIX = "recon_"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    # Upper bound of the bucket holding the q-th quantile (the observed max for the overflow bucket)
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "sum": round(self.sum, 6), "min": self.min, "max": self.max,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+# What a span yields: its duration, once the block has finished
+class Timing:
+    def __init__(self):
+        self.seconds = None
+
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def prometheus_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+
+# Counters, histograms and spans of one process. A span times a block of code into the
+# histogram <name>_seconds, counts failures in <name>_errors and, when tracing is on, is
+# written to the trace file with its parent span on the same thread.
+#
+# Labels become part of the metric key, so keep them low-cardinality (a host or a git
+# subcommand, not a URL or a repository).
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {}
+        self.histograms = {}
+        self.trace_file = None
+        self.started = time.time()
+
+    # A forked child starts with empty metrics and no lock held by a parent thread
+    def reset(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {}
+        self.histograms = {}
+        self.trace_file = None
+        self.started = time.time()
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, **labels):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        timing = Timing()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield timing
+        except BaseException as e:
+            error = type(e).__name__
+            self.count(f"{name}_errors", **labels)
+            raise
+        finally:
+            duration = timing.seconds = time.perf_counter() - start
+            stack.pop()
+            self.observe(f"{name}_seconds", duration, **labels)
+            if self.trace_file is not None:
+                self._trace(name, labels, parent, duration, error)
+
+    def _trace(self, name, labels, parent, duration, error):
+        entry = {"ts": round(time.time() - duration, 6), "span": name, "seconds": round(duration, 6),
+                 "thread": threading.current_thread().name}
+        if labels:
+            entry["labels"] = {k: str(v) for k, v in labels.items()}
+        if parent:
+            entry["parent"] = parent
+        if error:
+            entry["error"] = error
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self.trace_file is not None:
+                self.trace_file.write(line)
+
+    # Decorator form of span
+    def timed(self, name, **labels):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), **histogram.summary()}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {"started": self.started, "wall_seconds": round(time.time() - self.started, 3),
+                "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = prometheus_name(name) + "_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{prometheus_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            metric = prometheus_name(name)
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{prometheus_labels(labels, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{metric}_bucket{prometheus_labels(labels, [('le', '+Inf')])} {histogram.count}")
+            lines.append(f"{metric}_sum{prometheus_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{prometheus_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".prom":
+            path.write_text(self.to_prometheus())
+        else:
+            path.write_text(json.dumps(self.snapshot(), indent=2))
+
+
+REGISTRY = Registry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=REGISTRY.reset)
+
+count = REGISTRY.count
+observe = REGISTRY.observe
+span = REGISTRY.span
+timed = REGISTRY.timed
+
+
+# The git subcommand of a git command line (clone, fetch, cat-file, ...), skipping global options
+def git_subcommand(cmd):
+    args = iter(cmd[1:])
+    for arg in args:
+        if arg in ("-C", "-c", "--git-dir", "--work-tree"):
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return "git"
+
+
+# subprocess.run timed as a "subprocess" span, labelled with the program and git subcommand
+def run(cmd, **kwargs):
+    program = os.path.basename(str(cmd[0]))
+    labels = {"program": program}
+    if program == "git":
+        labels["command"] = git_subcommand(cmd)
+    with span("subprocess", **labels):
+        return subprocess.run(cmd, **kwargs)
+
+
+# session.request timed as an "http_request" span per host, with a counter per response status
+def request(session, method, url, **kwargs):
+    host = urlsplit(url).hostname or ""
+    with span("http_request", host=host, method=method):
+        response = session.request(method, url, **kwargs)
+    count("http_responses", host=host, status=response.status_code)
+    return response
+
+
+# cProfile runs on sys.monitoring from Python 3.12: one profiler sees every thread and a
+# second one cannot be enabled while it is active
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+
+
+class ThreadProfiler:
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def _new_profile(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        return profile
+
+    # Installed with threading.setprofile: runs once at the start of each new thread and
+    # replaces itself with that thread's own profiler
+    def _start_thread(self, frame, event, arg):
+        try:
+            self._new_profile().enable()
+        except ValueError:
+            # Another profiler is active in this process; the thread runs unprofiled
+            # rather than dying before its target starts
+            pass
+
+    def start(self):
+        if not PROCESS_WIDE_PROFILER:
+            threading.setprofile(self._start_thread)
+        self._new_profile().enable()
+
+    def dump(self, path):
+        threading.setprofile(None)
+        stats = None
+        with self._lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.disable()
+            try:
+                stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+            except TypeError:
+                # A thread that never made a profiled call has no stats
+                continue
+        if stats is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            stats.dump_stats(str(path))
+
+
+# Turn on the exports configured by the arguments or, failing that, RECON_METRICS, RECON_TRACE
+# and RECON_PROFILE. Metrics are always collected; this only decides what is written at exit.
+def install_from_env(metrics=None, trace=None, profile=None):
+    metrics = metrics or os.environ.get(METRICS_ENV)
+    trace = trace or os.environ.get(TRACE_ENV)
+    profile = profile or os.environ.get(PROFILE_ENV)
+
+    if trace:
+        Path(trace).parent.mkdir(parents=True, exist_ok=True)
+        REGISTRY.trace_file = open(trace, "a", buffering=1)
+
+    profiler = None
+    if profile:
+        profiler = ThreadProfiler()
+        profiler.start()
+
+    def finish():
+        if profiler is not None:
+            profiler.dump(profile)
+            logger.info(f"cProfile stats written to {profile}")
+        if metrics:
+            REGISTRY.export(metrics)
+            logger.info(f"Metrics written to {metrics}")
+        summary = [h for h in REGISTRY.snapshot()["histograms"] if h["count"]]
+        logger.info("Instrumentation summary", extra={"payload": summary})
+        if REGISTRY.trace_file is not None:
+            with REGISTRY._lock:
+                REGISTRY.trace_file.close()
+                REGISTRY.trace_file = None
+
+    atexit.register(finish)
+    return REGISTRY
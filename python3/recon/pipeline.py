@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import logging
+import math
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Items waiting between two stages; bounds memory whatever the number of repositories
+DEFAULT_QUEUE_SIZE = 64
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+
+# One step of a Pipeline. fn is called with every item from the previous stage (or a list of up
+# to batch_size items when batch_size is set) and returns the item to pass on, or None to drop
+# it; with fan_out=True it returns an iterable of items instead. on_finish is called once every
+# worker of the stage is done.
+#
+# priority, when given, turns the stage's input into a priority queue: workers take the waiting
+# item with the highest priority(item) first. defer, when given, holds back every item it is
+# true for until the rest of the input is done; deferred items then run highest priority first.
+# Either way items leave the stage in completion order, with deferred ones last, so whatever
+# consumes the output must not wait for source order (the scrapers sort their files at the end).
+class Stage:
+    def __init__(self, name, fn, workers=1, batch_size=None, fan_out=False, on_finish=None,
+                 priority=None, defer=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.fan_out = fan_out
+        self.on_finish = on_finish
+        self.priority = priority
+        self.defer = defer
+        self.items_in = 0
+        self.items_out = 0
+        self.items_deferred = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self._alive = self.workers
+        self._deferred = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def stats(self):
+        wall = (self.finished_at or time.monotonic()) - self.started_at if self.started_at else 0.0
+        return {"stage": self.name, "workers": self.workers, "items_in": self.items_in,
+                "items_out": self.items_out, "items_deferred": self.items_deferred, "errors": self.errors,
+                "busy_seconds": round(self.busy, 3), "wall_seconds": round(wall, 3)}
+
+    def _hold(self, item):
+        key = -self.priority(item) if self.priority is not None else 0
+        with self._lock:
+            heapq.heappush(self._deferred, (key, next(self._order), item))
+            self.items_deferred += 1
+
+    # Next deferred item, highest priority first, or None once they are all taken
+    def _next_deferred(self):
+        with self._lock:
+            return heapq.heappop(self._deferred)[2] if self._deferred else None
+
+
+# Bounded queue handing out the highest priority item first; the end-of-stream marker sorts
+# after every item, so it is only taken once the queue has drained
+class PriorityInput:
+    def __init__(self, priority, maxsize=0):
+        self.priority = priority
+        self._queue = queue.PriorityQueue(maxsize=maxsize)
+        self._order = itertools.count()
+
+    def put(self, item):
+        key = math.inf if item is _DONE else -self.priority(item)
+        self._queue.put((key, next(self._order), item))
+
+    def get(self):
+        return self._queue.get()[2]
+
+
+# Stages connected by bounded queues, each stage on its own worker threads, so network, git and
+# CPU work overlap: a run takes about as long as its slowest stage instead of the sum of all of
+# them. Iterating run(source) yields the output of the last stage on the calling thread, which
+# keeps single-threaded resources (SQLite connections, the console table) off the workers.
+class Pipeline:
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def _feed(self, source, output):
+        try:
+            for item in source:
+                output.put(item)
+        except Exception:
+            logger.exception("Pipeline source failed")
+        finally:
+            output.put(_DONE)
+
+    def _emit(self, stage, result, output):
+        if result is None:
+            return
+        for item in (result if stage.fan_out else (result,)):
+            if item is not None:
+                with stage._lock:
+                    stage.items_out += 1
+                output.put(item)
+
+    def _process(self, stage, work, output):
+        start = time.monotonic()
+        try:
+            result = stage.fn(work)
+            if stage.fan_out and result is not None:
+                result = list(result)
+        except Exception:
+            with stage._lock:
+                stage.errors += 1
+            logger.exception(f"Pipeline stage {stage.name} failed on {work!r}")
+            result = None
+        # Busy time is the work itself, not the time spent waiting for room in the next queue
+        with stage._lock:
+            stage.busy += time.monotonic() - start
+        self._emit(stage, result, output)
+
+    # Process item now, or add it to batch and process the batch once it is full; returns the open batch
+    def _take(self, stage, item, batch, output):
+        if stage.batch_size is None:
+            self._process(stage, item, output)
+            return batch
+        batch.append(item)
+        if len(batch) >= stage.batch_size:
+            self._process(stage, batch, output)
+            return []
+        return batch
+
+    def _work(self, stage, input, output):
+        with stage._lock:
+            if stage.started_at is None:
+                stage.started_at = time.monotonic()
+
+        batch = []
+        while True:
+            item = input.get()
+            if item is _DONE:
+                # Pass the end of the stream on to the next sibling worker straight away, so they
+                # all stop waiting on the input and drain the deferred items together
+                input.put(_DONE)
+                break
+            with stage._lock:
+                stage.items_in += 1
+            if stage.defer is not None and stage.defer(item):
+                stage._hold(item)
+                continue
+            batch = self._take(stage, item, batch, output)
+
+        # Every worker works through the deferred items, highest priority first
+        while (item := stage._next_deferred()) is not None:
+            batch = self._take(stage, item, batch, output)
+        if batch:
+            self._process(stage, batch, output)
+
+        with stage._lock:
+            stage._alive -= 1
+            last = stage._alive == 0
+        if not last:
+            return
+
+        stage.finished_at = time.monotonic()
+        if stage.on_finish is not None:
+            try:
+                stage.on_finish()
+            except Exception:
+                logger.exception(f"Pipeline stage {stage.name} on_finish failed")
+        output.put(_DONE)
+
+    # Push every item of source through the stages and yield what comes out of the last one
+    def run(self, source):
+        queues = [queue.Queue(maxsize=self.queue_size) if stage.priority is None
+                  else PriorityInput(stage.priority, maxsize=self.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(maxsize=self.queue_size))
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), name="pipeline-source", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(stage, queues[i], queues[i + 1]),
+                                                name=f"{stage.name}-{n}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            yield item
+
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
@@ -0,0 +1,66 @@
+import atexit
+import json
+import logging
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+from rich.logging import RichHandler
+
+
+# Compact one-object-per-line log format. Structured payloads passed through
+# extra={"payload": ...} are serialized here, on the listener thread, and only for
+# records that were actually emitted.
+class JsonlFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        payload = getattr(record, "payload", None)
+        if payload is not None:
+            entry["payload"] = payload
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+# Records that print_message already showed on the console, or details of an error it reported,
+# are only written to the file (extra={"printed": True})
+class SkipPrinted(logging.Filter):
+    def filter(self, record):
+        return not getattr(record, "printed", False)
+
+
+# Route all logging through a queue so callers only pay for enqueueing a record; the
+# listener thread formats it and does the file and console I/O. Returns the log file path.
+def setup_logging(log_dir, prefix="log_output", level=logging.DEBUG, console_level=logging.WARNING):
+    log_filename = Path(log_dir) / f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+
+    file_handler = logging.FileHandler(str(log_filename))
+    file_handler.setFormatter(JsonlFormatter())
+    file_handler.setLevel(level)
+
+    console_handler = RichHandler()
+    console_handler.setLevel(console_level)
+    console_handler.addFilter(SkipPrinted())
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(min(level, console_level))
+
+    listener.start()
+    # Drain the queue before the interpreter exits
+    atexit.register(listener.stop)
+    return log_filename
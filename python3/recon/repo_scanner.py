@@ -0,0 +1,112 @@
+import logging
+import mmap
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+Match = namedtuple("Match", ["repo", "file", "line", "pattern", "text"])
+
+# Directories that hold dependencies, build output or VCS metadata rather than the project's own files
+IGNORED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "bower_components", "vendor", "third_party",
+    "dist", "build", "target", "out", ".venv", "venv", ".tox", "__pycache__", ".mypy_cache",
+}
+
+# Same heuristic as grep/git: a NUL byte near the start of the file means binary
+BINARY_SNIFF_BYTES = 8192
+MAX_FILE_BYTES = 20 * 1024 * 1024
+
+
+# One alternation over every pattern so each file is read exactly once, whatever the number of
+# patterns. Longer patterns come first so they win when one pattern is a prefix of another.
+@lru_cache(maxsize=32)
+def compile_patterns(patterns):
+    encoded = sorted({p.encode() for p in patterns}, key=len, reverse=True)
+    regex = re.compile(b"|".join(re.escape(p) for p in encoded))
+    lookup = {p: p.decode() for p in encoded}
+    return regex, lookup
+
+
+# Walk repo_path, pruning ignored directories before descending into them
+def iter_files(repo_path):
+    for dirpath, dirnames, filenames in os.walk(repo_path):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if not os.path.islink(path):
+                yield path
+
+
+# Return (line number, pattern, line text) for every line of buf (bytes or mmap) that matches
+def scan_buffer(buf, regex, lookup):
+    results = []
+    seen = set()
+    line_no = 1
+    counted_to = 0
+    for m in regex.finditer(buf):
+        line_start = buf.rfind(b"\n", 0, m.start()) + 1
+        # Count newlines incrementally so the whole scan stays linear in the buffer size
+        line_no += buf[counted_to:line_start].count(b"\n")
+        counted_to = line_start
+
+        pattern = lookup[m.group()]
+        if (line_no, pattern) in seen:
+            continue
+        seen.add((line_no, pattern))
+
+        line_end = buf.find(b"\n", m.end())
+        if line_end == -1:
+            line_end = len(buf)
+        text = buf[line_start:line_end].decode("utf-8", errors="replace").rstrip("\r")
+        results.append((line_no, pattern, text))
+    return results
+
+
+# Same NUL sniff for files and blobs read from git
+def is_binary(buf):
+    return buf.find(b"\0", 0, BINARY_SNIFF_BYTES) != -1
+
+
+# Return (line number, pattern, line text) for every line of path that matches
+def scan_file(path, regex, lookup):
+    try:
+        size = os.path.getsize(path)
+        if size == 0 or size > MAX_FILE_BYTES:
+            return []
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if is_binary(mm):
+                return []
+            return scan_buffer(mm, regex, lookup)
+    except (OSError, ValueError) as e:
+        logger.debug(f"Skipping {path}: {e}")
+        return []
+
+
+# Scan one repository for every pattern in a single pass. files restricts the scan to
+# those paths (relative to repo_path) instead of walking the whole tree.
+def scan_repo(repo_path, patterns, files=None):
+    repo_path = str(repo_path)
+    regex, lookup = compile_patterns(tuple(patterns))
+
+    if files is None:
+        paths = iter_files(repo_path)
+    else:
+        paths = (os.path.join(repo_path, f) for f in files)
+
+    matches = []
+    for path in paths:
+        relative = os.path.relpath(path, repo_path)
+        if any(part in IGNORED_DIRS for part in Path(relative).parts[:-1]):
+            continue
+        for line_no, pattern, text in scan_file(path, regex, lookup):
+            matches.append(Match(repo_path, relative, line_no, pattern, text))
+    return matches
+
+
+# grep -n style "path:line:text" rendering of a match
+def format_match(match):
+    return f"{os.path.join(match.repo, match.file)}:{match.line}:{match.text}"
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import instrumentation
+from clone_pool import GIT_ENV
+
+logger = logging.getLogger(__name__)
+
+
+# Bytes a directory tree takes on disk (allocated blocks, like du)
+@instrumentation.timed("disk_usage")
+def disk_usage(path):
+    total = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_blocks * 512
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def run_git(*args):
+    return instrumentation.run(["git", *args], capture_output=True, text=True, env=GIT_ENV)
+
+
+# Cloned repositories on disk: an optional shared reference repository that holds every
+# object once, and a last-used index that evicts the least recently scanned repositories
+# once the clones outgrow a disk budget.
+#
+# New clones borrow from the reference through git alternates (clone --reference-if-able),
+# so objects shared with an earlier fork or mirror are not downloaded or stored again. Each
+# clone's own objects are then absorbed into the reference: every ref of the clone (branches,
+# remote-tracking branches, tags) is copied under refs/repos/<org>/<repo>/, so everything the
+# clone can reach stays reachable in the reference, and the clone drops its copies with
+# repack -l. Evicting a clone deletes its refs, and a gc of the reference prunes whatever no
+# remaining clone needs.
+class RepoStore:
+    def __init__(self, index_path, reference=None):
+        self.index_path = Path(index_path)
+        self.reference = Path(reference) if reference else None
+        self.repos = {}
+        self._lock = threading.Lock()
+        # Fetches into the reference repository run one at a time
+        self._reference_lock = threading.Lock()
+        if self.index_path.exists():
+            try:
+                with open(self.index_path) as f:
+                    self.repos = json.load(f).get("repos", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable repository store index {self.index_path}: {e}")
+
+        if self.reference is not None and not self.reference.exists():
+            self.reference.parent.mkdir(parents=True, exist_ok=True)
+            result = run_git("init", "--quiet", "--bare", str(self.reference))
+            if result.returncode != 0:
+                logger.error(f"Could not create the reference repository {self.reference}: {result.stderr.strip()}")
+                self.reference = None
+
+    @instrumentation.timed("file_write", target="repo_store")
+    def save(self):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with self._lock:
+            data = json.dumps({"repos": self.repos})
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+    def _ref(self, key):
+        return f"refs/repos/{key}"
+
+    # Delete the refs kept for key: the ones under refs/repos/<key>/ and the single HEAD ref
+    # earlier versions stored at refs/repos/<key>
+    def _delete_refs(self, key):
+        # The pattern matches refs/repos/<key> itself and everything below it, not refs/repos/<key>-fork
+        result = run_git("--git-dir", str(self.reference), "for-each-ref", "--format=%(refname)", self._ref(key))
+        refs = result.stdout.split() if result.returncode == 0 else []
+        if not refs:
+            return
+        commands = "".join(f"delete {ref}\n" for ref in refs)
+        instrumentation.run(["git", "--git-dir", str(self.reference), "update-ref", "--stdin"],
+                            input=commands, capture_output=True, text=True, env=GIT_ENV)
+
+    # Move the objects of the clone at repo_path into the reference repository. Clones made
+    # before the reference existed get an alternates entry first. Returns True on success.
+    # Shallow clones are left alone: fetching from them would make the reference shallow,
+    # and git clone --reference-if-able ignores a shallow reference.
+    def absorb(self, key, repo_path):
+        if self.reference is None:
+            return False
+        repo_path = Path(repo_path)
+        git_dir = repo_path / ".git" if (repo_path / ".git").is_dir() else repo_path
+        if (git_dir / "shallow").exists():
+            logger.warning(f"Not absorbing shallow clone {key} into {self.reference}")
+            return False
+        alternates = git_dir / "objects" / "info" / "alternates"
+        reference_objects = str((self.reference / "objects").resolve())
+
+        with self._reference_lock:
+            # Replaces the refs of an earlier absorb, including a single ref in the old layout
+            self._delete_refs(key)
+            result = run_git("--git-dir", str(self.reference), "fetch", "--quiet", "--no-tags",
+                             str(repo_path), f"+refs/*:{self._ref(key)}/*")
+        if result.returncode != 0:
+            logger.warning(f"Could not absorb {key} into {self.reference}: {result.stderr.strip()}")
+            self.dissociate(git_dir)
+            return False
+
+        if not alternates.exists() or reference_objects not in alternates.read_text().split():
+            alternates.parent.mkdir(parents=True, exist_ok=True)
+            with open(alternates, "a") as f:
+                f.write(reference_objects + "\n")
+
+        # -l leaves out every object the alternates already have
+        result = run_git("--git-dir", str(git_dir), "repack", "-a", "-d", "-l", "-q")
+        if result.returncode != 0:
+            logger.warning(f"git repack failed in {repo_path}: {result.stderr.strip()}")
+            return False
+        with self._lock:
+            self.repos.setdefault(key, {"path": str(repo_path), "last_used": time.time(), "bytes": 0})["absorbed"] = True
+        return True
+
+    # Copy every borrowed object into the repository and stop using the reference, for clones
+    # whose objects could not be absorbed
+    def dissociate(self, git_dir):
+        alternates = Path(git_dir) / "objects" / "info" / "alternates"
+        if not alternates.exists():
+            return
+        result = run_git("--git-dir", str(git_dir), "repack", "-a", "-d", "-q")
+        if result.returncode == 0:
+            alternates.unlink()
+        else:
+            logger.error(f"Could not dissociate {git_dir} from {self.reference}: {result.stderr.strip()}")
+
+    # Absorb a fresh clone, or an existing one that never was absorbed (cloned before the reference
+    # existed, or interrupted in between), so gc of the reference never drops objects it borrows
+    def add_clone(self, key, repo_path, cloned):
+        if self.reference is None:
+            return False
+        with self._lock:
+            absorbed = self.repos.get(key, {}).get("absorbed", False)
+        if cloned or not absorbed:
+            return self.absorb(key, repo_path)
+        return True
+
+    # Record that key at path was used (scanned) now. Cheap enough for every result row: sizes
+    # on disk are only measured when evicting
+    def touch(self, key, path):
+        with self._lock:
+            entry = self.repos.setdefault(key, {"bytes": 0})
+            entry.update({"path": str(path), "last_used": time.time()})
+
+    # Measure every clone on disk again; clones grow when fetched, so sizes from an earlier run are stale
+    def measure(self):
+        with self._lock:
+            paths = {key: entry["path"] for key, entry in self.repos.items()}
+        sizes = {key: disk_usage(path) for key, path in paths.items()}
+        with self._lock:
+            for key, size in sizes.items():
+                if key in self.repos:
+                    self.repos[key]["bytes"] = size
+
+    def total_bytes(self):
+        with self._lock:
+            total = sum(entry.get("bytes", 0) for entry in self.repos.values())
+        if self.reference is not None:
+            total += disk_usage(self.reference)
+        return total
+
+    # Remove least recently used repositories until everything fits in budget_bytes.
+    # Returns the evicted keys.
+    def evict(self, budget_bytes):
+        self.measure()
+        total = self.total_bytes()
+        evicted = []
+        with self._lock:
+            for key, entry in sorted(self.repos.items(), key=lambda item: item[1]["last_used"]):
+                if total <= budget_bytes:
+                    break
+                shutil.rmtree(entry["path"], ignore_errors=True)
+                total -= entry["bytes"]
+                evicted.append(key)
+            for key in evicted:
+                del self.repos[key]
+
+        if evicted and self.reference is not None:
+            with self._reference_lock:
+                for key in evicted:
+                    self._delete_refs(key)
+            # Drop the objects only the evicted repositories referenced
+            result = run_git("--git-dir", str(self.reference), "gc", "--quiet", "--prune=now")
+            if result.returncode != 0:
+                logger.warning(f"git gc failed in {self.reference}: {result.stderr.strip()}")
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} repositories to fit {budget_bytes} bytes", extra={"payload": evicted})
+        return evicted
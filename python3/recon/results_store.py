@@ -0,0 +1,211 @@
+import argparse
+import csv
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import instrumentation
+
+DEFAULT_DB_PATH = Path.home() / "git" / "bounties" / "results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    script TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS repos (
+    organization TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    repo_url TEXT,
+    first_seen_run INTEGER NOT NULL REFERENCES runs(id),
+    last_seen_run INTEGER NOT NULL REFERENCES runs(id),
+    PRIMARY KEY (organization, repo)
+);
+CREATE TABLE IF NOT EXISTS repo_results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    organization TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    languages TEXT,
+    automated_security_fixes TEXT,
+    PRIMARY KEY (run_id, organization, repo)
+);
+CREATE TABLE IF NOT EXISTS workflow_status (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    organization TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    has_pull_request_target INTEGER NOT NULL,
+    PRIMARY KEY (run_id, organization, repo)
+);
+CREATE TABLE IF NOT EXISTS workflow_matches (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    organization TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    file TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    pattern TEXT NOT NULL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_script ON runs (script, id);
+CREATE INDEX IF NOT EXISTS idx_repo_results_repo ON repo_results (organization, repo, run_id);
+CREATE INDEX IF NOT EXISTS idx_workflow_matches_run ON workflow_matches (run_id, organization, repo);
+"""
+
+REPO_COLUMNS = ["Organization", "Repo", "Repo URL", "Languages", "Automated Security Fixes"]
+
+
+# SQLite store of every huntr run: repositories, languages, security fix status and
+# workflow matches, so runs can be compared with indexed queries instead of diffing CSVs
+class ResultsStore:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets a second process (or the CLI below) read while a run is writing
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, script):
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO runs (script, started_at) VALUES (?, ?)",
+                                       (script, datetime.now().isoformat(timespec="seconds")))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        with self.conn:
+            self.conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?",
+                              (datetime.now().isoformat(timespec="seconds"), run_id))
+
+    # The most recent finished run of the same script before run_id
+    def previous_run(self, run_id):
+        row = self.conn.execute(
+            "SELECT p.id FROM runs p JOIN runs r ON r.id = ? "
+            "WHERE p.script = r.script AND p.id < r.id AND p.finished_at IS NOT NULL "
+            "ORDER BY p.id DESC LIMIT 1", (run_id,)).fetchone()
+        return row["id"] if row else None
+
+    def latest_run(self, script=None):
+        if script is None:
+            row = self.conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = self.conn.execute("SELECT id FROM runs WHERE script = ? ORDER BY id DESC LIMIT 1",
+                                    (script,)).fetchone()
+        return row["id"] if row else None
+
+    @instrumentation.timed("db_write", table="repo_results")
+    def add_repo_result(self, run_id, organization, repo, repo_url, languages, automated_security_fixes=None):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO repos (organization, repo, repo_url, first_seen_run, last_seen_run) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (organization, repo) DO UPDATE SET repo_url = excluded.repo_url, "
+                "last_seen_run = excluded.last_seen_run",
+                (organization, repo, repo_url, run_id, run_id))
+            self.conn.execute(
+                "INSERT INTO repo_results (run_id, position, organization, repo, languages, automated_security_fixes) "
+                "VALUES (?, (SELECT COUNT(*) FROM repo_results WHERE run_id = ?), ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, organization, repo) DO UPDATE SET languages = excluded.languages, "
+                "automated_security_fixes = excluded.automated_security_fixes",
+                (run_id, run_id, organization, repo, languages, automated_security_fixes))
+
+    # Record the scan result of one repository; matches are repo_scanner.Match records
+    @instrumentation.timed("db_write", table="workflow_matches")
+    def add_workflow_matches(self, run_id, organization, repo, matches):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workflow_status (run_id, organization, repo, has_pull_request_target) "
+                "VALUES (?, ?, ?, ?)",
+                (run_id, organization, repo, int(any(m.pattern == "pull_request_target" for m in matches))))
+            self.conn.execute("DELETE FROM workflow_matches WHERE run_id = ? AND organization = ? AND repo = ?",
+                              (run_id, organization, repo))
+            self.conn.executemany(
+                "INSERT INTO workflow_matches (run_id, organization, repo, file, line, pattern, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, organization, repo, m.file, m.line, m.pattern, m.text) for m in matches])
+
+    def repo_results(self, run_id):
+        return self.conn.execute(
+            "SELECT rr.organization, rr.repo, r.repo_url, rr.languages, rr.automated_security_fixes "
+            "FROM repo_results rr JOIN repos r USING (organization, repo) "
+            "WHERE rr.run_id = ? ORDER BY rr.position", (run_id,)).fetchall()
+
+    # Repositories in run_id that were not in the previous run of the same script
+    def new_repos_since_last_run(self, run_id):
+        previous = self.previous_run(run_id)
+        return self.conn.execute(
+            "SELECT organization, repo FROM repo_results cur WHERE cur.run_id = ? AND NOT EXISTS ("
+            "SELECT 1 FROM repo_results prev WHERE prev.run_id = ? "
+            "AND prev.organization = cur.organization AND prev.repo = cur.repo) "
+            "ORDER BY cur.position", (run_id, previous if previous is not None else -1)).fetchall()
+
+    # Repositories scanned in both this run and the previous one whose pull_request_target
+    # status flipped; repositories new in this run (and every repository of a first run) are
+    # not changes
+    def pull_request_target_changes(self, run_id):
+        previous = self.previous_run(run_id)
+        if previous is None:
+            return []
+        return self.conn.execute(
+            "SELECT cur.organization, cur.repo, prev.has_pull_request_target AS previous, "
+            "cur.has_pull_request_target AS current "
+            "FROM workflow_status cur JOIN workflow_status prev "
+            "ON prev.run_id = ? AND prev.organization = cur.organization AND prev.repo = cur.repo "
+            "WHERE cur.run_id = ? AND prev.has_pull_request_target IS NOT cur.has_pull_request_target "
+            "ORDER BY cur.organization, cur.repo",
+            (previous, run_id)).fetchall()
+
+    # Write the repositories of a run as CSV; include_security_fixes=False drops the last column
+    def export_csv(self, run_id, csv_filename, include_security_fixes=True):
+        columns = REPO_COLUMNS if include_security_fixes else REPO_COLUMNS[:-1]
+        with open(csv_filename, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for row in self.repo_results(run_id):
+                writer.writerow(list(row)[:len(columns)])
+        return csv_filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the huntr results store")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help=f"Results database (default: {DEFAULT_DB_PATH})")
+    parser.add_argument("--run", type=int, help="Run id (default: the latest run)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("runs", help="List runs")
+    subparsers.add_parser("new-repos", help="Repositories new since the previous run")
+    subparsers.add_parser("pr-target-changes", help="Repositories whose pull_request_target status changed")
+    export_parser = subparsers.add_parser("export", help="Export a run as CSV")
+    export_parser.add_argument("csv_filename", type=Path)
+    export_parser.add_argument("--no-security-fixes", action="store_true",
+                               help="Leave out the automated security fixes column")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    run_id = args.run or store.latest_run()
+
+    if args.command == "runs":
+        for row in store.conn.execute("SELECT * FROM runs ORDER BY id"):
+            print(f"{row['id']:>5}  {row['script']:<36} {row['started_at']}  {row['finished_at'] or 'unfinished'}")
+    elif run_id is None:
+        parser.error("the results store has no runs yet")
+    elif args.command == "new-repos":
+        for row in store.new_repos_since_last_run(run_id):
+            print(f"{row['organization']}/{row['repo']}")
+    elif args.command == "pr-target-changes":
+        for row in store.pull_request_target_changes(run_id):
+            print(f"{row['organization']}/{row['repo']}: {row['previous']} -> {row['current']}")
+    elif args.command == "export":
+        store.export_csv(run_id, args.csv_filename, include_security_fixes=not args.no_security_fixes)
+        print(f"CSV file saved: {args.csv_filename}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
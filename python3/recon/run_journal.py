@@ -0,0 +1,108 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Stages recorded by the huntr scrapers; each is written once a repository completes it
+RUN_STARTED = "run_started"
+SCRAPED = "scraped"
+SCRAPE_COMPLETE = "scrape_complete"
+ENRICHED = "enriched"
+CLONED = "cloned"
+RUN_FINISHED = "run_finished"
+
+
+# Everything a journal says has been done, rebuilt by replaying its records in order
+class JournalState:
+    def __init__(self):
+        self.run = {}
+        # Insertion-ordered set, a scrape interrupted before SCRAPE_COMPLETE is redone on resume
+        self.scraped = {}
+        self.scrape_complete = False
+        self.enriched = {}
+        self.cloned = {}
+        self.finished = False
+
+    def apply(self, record):
+        stage = record["stage"]
+        key = (record["org"], record["repo"]) if "org" in record else None
+        data = record.get("data")
+        if stage == RUN_STARTED:
+            self.run = data
+        elif stage == SCRAPED:
+            self.scraped[key] = None
+        elif stage == SCRAPE_COMPLETE:
+            self.scrape_complete = True
+        elif stage == ENRICHED:
+            self.enriched[key] = data
+        elif stage == CLONED:
+            self.cloned[key] = data
+        elif stage == RUN_FINISHED:
+            self.finished = True
+
+
+# Append-only JSONL journal of completed work. Every record is flushed as soon as it is
+# written, so a crash, Ctrl-C or rate-limit exhaustion loses at most the in-flight repos.
+class RunJournal:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.state = self.replay(self.path)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a+")
+        # Terminate a truncated last line so the next record starts on a line of its own
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    # New journal for a fresh run of script
+    @classmethod
+    def create(cls, journal_dir, script):
+        return cls(Path(journal_dir) / f"{script}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+    # The most recent journal of script, when that run did not reach RUN_FINISHED; None when the
+    # last run finished, so an older abandoned journal is never picked up after a completed run
+    @classmethod
+    def latest_unfinished(cls, journal_dir, script):
+        paths = sorted(Path(journal_dir).glob(f"{script}_*.jsonl"))
+        if not paths or cls.replay(paths[-1]).finished:
+            return None
+        return cls(paths[-1])
+
+    @staticmethod
+    def replay(path):
+        state = JournalState()
+        if not Path(path).exists():
+            return state
+        with open(path) as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    state.apply(json.loads(line))
+                except (ValueError, KeyError):
+                    # A run killed mid-write can leave a truncated last line
+                    logger.warning(f"Ignoring unreadable journal record {path}:{line_no}")
+        return state
+
+    @instrumentation.timed("file_write", target="journal")
+    def record(self, stage, org=None, repo=None, data=None):
+        record = {"ts": time.time(), "stage": stage}
+        if org is not None:
+            record["org"] = org
+            record["repo"] = repo
+        if data is not None:
+            record["data"] = data
+        with self._lock:
+            self.state.apply(record)
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
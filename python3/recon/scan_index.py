@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import instrumentation
+import repo_scanner
+
+logger = logging.getLogger(__name__)
+
+CACHED = "cached"
+INCREMENTAL = "incremental"
+FULL = "full"
+
+
+# Resolve HEAD by reading .git directly, which is far cheaper than a git subprocess per
+# repository on a steady-state run. Falls back to git rev-parse for anything unusual.
+def read_head(repo_root):
+    git_dir = Path(repo_root) / ".git"
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[len("ref: "):]
+        ref_path = git_dir / ref
+        if ref_path.exists():
+            return ref_path.read_text().strip()
+        packed_refs = git_dir / "packed-refs"
+        if packed_refs.exists():
+            for line in packed_refs.read_text().splitlines():
+                if line.endswith(f" {ref}"):
+                    return line.split(" ", 1)[0]
+    except OSError:
+        pass
+
+    result = instrumentation.run(["git", "-C", str(repo_root), "rev-parse", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+# Files under scan_root that changed between two commits, relative to scan_root.
+# Returns None when the old commit is not available (e.g. shallow clones), forcing a full rescan.
+def changed_files(scan_root, old_head, new_head):
+    result = instrumentation.run(["git", "-C", str(scan_root), "diff", "--name-only", "--relative", old_head, new_head],
+                                 capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return [line for line in result.stdout.splitlines() if line]
+
+
+# Persistent record of the last scanned HEAD and matches of every repository, so repeat runs
+# only rescan repositories that moved, and only the files that changed
+class ScanIndex:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.repos = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                with open(self.path) as f:
+                    self.repos = json.load(f).get("repos", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable scan index {self.path}: {e}")
+
+    @instrumentation.timed("file_write", target="scan_index")
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"repos": self.repos}, f)
+        os.replace(tmp_path, self.path)
+
+    def matches(self, key, scan_root):
+        entry = self.repos.get(key, {})
+        return [repo_scanner.Match(str(scan_root), *match) for match in entry.get("matches", [])]
+
+    def update(self, key, head, patterns, matches):
+        self.repos[key] = {
+            "head": head,
+            "patterns": sorted(patterns),
+            "scanned_at": time.time(),
+            "matches": [[m.file, m.line, m.pattern, m.text] for m in matches],
+        }
+
+    # Decide how one repository has to be scanned. Returns (mode, head, files), files being the
+    # changed files to rescan for INCREMENTAL and None otherwise.
+    def plan(self, key, repo_root, scan_root, patterns, full_rescan=False):
+        patterns = sorted(patterns)
+        head = read_head(repo_root)
+        entry = self.repos.get(key)
+
+        if full_rescan or head is None or entry is None or entry.get("patterns") != patterns:
+            return FULL, head, None
+        if entry["head"] == head:
+            return CACHED, head, None
+        changed = changed_files(scan_root, entry["head"], head)
+        if changed is None:
+            return FULL, head, None
+        return INCREMENTAL, head, changed
+
+    # Combine the matches of a planned scan with the cached ones and remember the result.
+    # new_matches is ignored for CACHED. Returns every match of the repository.
+    def record(self, key, scan_root, mode, head, patterns, new_matches, files=None):
+        if mode == CACHED:
+            return self.matches(key, scan_root)
+
+        if mode == INCREMENTAL:
+            # Keep the cached matches of files that did not change
+            changed = set(files)
+            kept = [m for m in self.matches(key, scan_root) if m.file not in changed]
+            new_matches = sorted(kept + new_matches, key=lambda m: (m.file, m.line, m.pattern))
+
+        if head is not None:
+            with self._lock:
+                self.update(key, head, sorted(patterns), new_matches)
+        return new_matches
@@ -0,0 +1,119 @@
+import csv
+import os
+from collections import deque
+
+from rich.live import Live
+from rich.table import Table
+
+import instrumentation
+
+# Rows kept on screen by the live table
+DEFAULT_WINDOW = 20
+
+# Column widths in the plain-text table file, which is written before the widest cell is known;
+# longer cells are written in full
+MIN_TEXT_WIDTH = 20
+MAX_TEXT_WIDTH = 40
+
+
+# Result rows streamed to disk and screen as they are produced: every row is appended and
+# flushed to a CSV file and a plain-text table file straight away, and the console shows a
+# live table of the last `window` rows. Nothing grows with the number of rows, unlike a
+# rich.Table of every row exported from a Console(record=True) at the end of the run.
+#
+# Rows are written in the order they arrive. sort_key, when given, is called with the cells
+# of each row once the table is closed, and both files are rewritten in that order; only
+# then are all the rows read back into memory.
+#
+# columns is a list of (header, rich column options) pairs.
+class StreamingTable:
+    def __init__(self, console, columns, csv_path, text_path, title=None, window=DEFAULT_WINDOW, sort_key=None,
+                 **table_options):
+        self.console = console
+        self.columns = columns
+        self.title = title
+        self.sort_key = sort_key
+        self.table_options = table_options
+        self.rows = deque(maxlen=window)
+        self.count = 0
+        self.csv_path = csv_path
+        self.text_path = text_path
+
+        self.headers = [header for header, _ in columns]
+        self.widths = [min(MAX_TEXT_WIDTH, max(len(header), options.get("width") or MIN_TEXT_WIDTH))
+                       for header, options in columns]
+        self._csv_file, self._csv, self._text_file = self._open(csv_path, text_path)
+        self._flush()
+        self._live = Live(console=console, get_renderable=self.render, refresh_per_second=4)
+
+    # Open both files and write their headers
+    def _open(self, csv_path, text_path):
+        csv_file = open(csv_path, "w", newline="")
+        writer = csv.writer(csv_file)
+        writer.writerow(self.headers)
+        text_file = open(text_path, "w")
+        if self.title:
+            text_file.write(f"{self.title}\n")
+        self._write_text(text_file, self.headers)
+        text_file.write("  ".join("-" * width for width in self.widths) + "\n")
+        return csv_file, writer, text_file
+
+    def _write_text(self, text_file, cells):
+        text_file.write("  ".join(f"{cell:<{width}}" for cell, width in zip(cells, self.widths)).rstrip() + "\n")
+
+    def _flush(self):
+        self._csv_file.flush()
+        self._text_file.flush()
+
+    @instrumentation.timed("file_write", target="results_table")
+    def add_row(self, *row):
+        cells = ["" if cell is None else str(cell) for cell in row]
+        self._csv.writerow(cells)
+        self._write_text(self._text_file, cells)
+        self._flush()
+        self.rows.append(cells)
+        self.count += 1
+
+    # Called by the live display's refresh thread
+    def render(self):
+        table = Table(title=self.title, **self.table_options)
+        for header, options in self.columns:
+            table.add_column(header, **options)
+        for cells in list(self.rows):
+            table.add_row(*cells)
+        if self.count > len(self.rows):
+            table.caption = f"Last {len(self.rows)} of {self.count} rows, all rows in {self.text_path}"
+        return table
+
+    def start(self):
+        self._live.start()
+        return self
+
+    # Rewrite both files with the rows in sort_key order, through temporary files so a crash
+    # leaves the streamed files as they were
+    @instrumentation.timed("file_write", target="results_table_sort")
+    def _sort_files(self):
+        with open(self.csv_path, newline="") as f:
+            rows = list(csv.reader(f))[1:]
+        rows.sort(key=self.sort_key)
+        csv_tmp, text_tmp = f"{self.csv_path}.tmp", f"{self.text_path}.tmp"
+        csv_file, writer, text_file = self._open(csv_tmp, text_tmp)
+        with csv_file, text_file:
+            for cells in rows:
+                writer.writerow(cells)
+                self._write_text(text_file, cells)
+        os.replace(csv_tmp, self.csv_path)
+        os.replace(text_tmp, self.text_path)
+
+    def close(self):
+        self._live.stop()
+        self._csv_file.close()
+        self._text_file.close()
+        if self.sort_key is not None:
+            self._sort_files()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,174 @@
+import logging
+import os
+import re
+from pathlib import Path
+
+import yaml
+
+import instrumentation
+import repo_scanner
+
+logger = logging.getLogger(__name__)
+
+# libyaml's C loader parses several times faster than the pure Python one
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Identifies analyzer results in the scan caches; bump it whenever a rule changes
+ANALYZER_ID = "workflow_analyzer:1"
+
+RULE_TRIGGER = "pull_request_target"
+RULE_HEAD_CHECKOUT = "pull_request_target_head_checkout"
+RULE_UNTRUSTED_INPUT = "untrusted_input_in_run"
+RULE_YAML_ERROR = "yaml_error"
+
+WORKFLOW_SUFFIXES = (".yml", ".yaml")
+
+# Expressions that resolve to the pull request's own (attacker controlled) code
+HEAD_REF_EXPRESSIONS = re.compile(
+    r"github\.event\.pull_request\.head\.(sha|ref|repo\.full_name)|github\.head_ref|refs/pull/")
+HEAD_CHECKOUT_COMMANDS = re.compile(r"\b(gh pr checkout|git (fetch|checkout)\b.*(head|pull/))")
+# Event fields anyone opening a pull request, issue or comment controls
+UNTRUSTED_INPUTS = re.compile(
+    r"\$\{\{\s*(github\.event\.(pull_request\.(title|body|head\.ref|head\.label)|issue\.(title|body)"
+    r"|comment\.body|review\.body|review_comment\.body|pages\.[^}]*\.page_name|commits\.[^}]*\.message"
+    r"|head_commit\.message|head_commit\.author\.(email|name))|github\.head_ref)\s*\}\}")
+
+# Cheap pre-filter: a workflow without either marker cannot match any rule, so skip parsing it
+PREFILTER = (b"pull_request_target", b"${{")
+
+LINE_KEY = "__line__"
+KEY_LINES = "__key_lines__"
+
+
+# Safe loader that records the line of every mapping under LINE_KEY and of each of its keys under KEY_LINES
+class LineLoader(Loader):
+    def construct_mapping(self, node, deep=False):
+        mapping = super().construct_mapping(node, deep=deep)
+        mapping[LINE_KEY] = node.start_mark.line + 1
+        mapping[KEY_LINES] = {self.construct_object(key_node): key_node.start_mark.line + 1
+                              for key_node, _ in node.value if key_node.tag != "tag:yaml.org,2002:merge"}
+        return mapping
+
+
+def line_of(mapping, key=None, default=1):
+    if not isinstance(mapping, dict):
+        return default
+    if key is not None and key in mapping.get(KEY_LINES, {}):
+        return mapping[KEY_LINES][key]
+    return mapping.get(LINE_KEY, default)
+
+
+# YAML 1.1 reads a bare `on` key as the boolean True
+def workflow_triggers(doc):
+    on = doc.get("on", doc.get(True))
+    if isinstance(on, str):
+        return {on: None}
+    if isinstance(on, list):
+        return {trigger: None for trigger in on if isinstance(trigger, str)}
+    if isinstance(on, dict):
+        return {trigger: config for trigger, config in on.items() if trigger not in (LINE_KEY, KEY_LINES)}
+    return {}
+
+
+def job_steps(job):
+    steps = job.get("steps") if isinstance(job, dict) else None
+    return [step for step in steps if isinstance(step, dict)] if isinstance(steps, list) else []
+
+
+# Does the step check out the pull request's head instead of the base repository?
+def checks_out_head(step):
+    uses = step.get("uses")
+    if isinstance(uses, str) and uses.startswith("actions/checkout"):
+        options = step.get("with") if isinstance(step.get("with"), dict) else {}
+        return any(HEAD_REF_EXPRESSIONS.search(str(options.get(key, ""))) for key in ("ref", "repository"))
+    run = step.get("run")
+    return isinstance(run, str) and bool(HEAD_CHECKOUT_COMMANDS.search(run)) and bool(HEAD_REF_EXPRESSIONS.search(run))
+
+
+# Cheap enough to run before handing a workflow to another process
+def might_match(data):
+    return any(marker in data for marker in PREFILTER)
+
+
+def step_name(step, index):
+    return step.get("name") or step.get("id") or step.get("uses") or f"step {index + 1}"
+
+
+# Parse one workflow and evaluate the rules. Returns (line, rule, detail) tuples, the same
+# shape as repo_scanner.scan_buffer, so results share the scan caches and the results store.
+@instrumentation.timed("parse_workflow")
+def analyze_workflow(data):
+    if not might_match(data):
+        return []
+    try:
+        doc = yaml.load(data, Loader=LineLoader)
+    except yaml.YAMLError as e:
+        mark = getattr(e, "problem_mark", None)
+        return [(mark.line + 1 if mark else 1, RULE_YAML_ERROR, str(e).splitlines()[0])]
+    if not isinstance(doc, dict):
+        return []
+
+    findings = []
+    triggers = workflow_triggers(doc)
+    pull_request_target = RULE_TRIGGER in triggers
+    if pull_request_target:
+        on_key = "on" if "on" in doc else True
+        on = doc.get(on_key)
+        line = line_of(on, RULE_TRIGGER) if isinstance(on, dict) else line_of(doc, on_key)
+        findings.append((line, RULE_TRIGGER, f"on: {', '.join(str(t) for t in triggers)}"))
+
+    jobs = doc.get("jobs") if isinstance(doc.get("jobs"), dict) else {}
+    for job_id, job in jobs.items():
+        if job_id in (LINE_KEY, KEY_LINES):
+            continue
+        for index, step in enumerate(job_steps(job)):
+            name = step_name(step, index)
+            if pull_request_target and checks_out_head(step):
+                findings.append((line_of(step), RULE_HEAD_CHECKOUT,
+                                 f"job {job_id}, {name}: checks out the pull request head in a pull_request_target workflow"))
+            run = step.get("run")
+            if isinstance(run, str):
+                for expression in dict.fromkeys(m.group(0) for m in UNTRUSTED_INPUTS.finditer(run)):
+                    findings.append((line_of(step), RULE_UNTRUSTED_INPUT, f"job {job_id}, {name}: {expression} in run"))
+    return sorted(findings)
+
+
+# The workflow directory of scan_root: scan_root itself for sparse workflow-only scan roots
+def workflows_dir(scan_root):
+    scan_root = Path(scan_root)
+    if scan_root.name == "workflows" and scan_root.parent.name == ".github":
+        return scan_root
+    return scan_root / ".github" / "workflows"
+
+
+def is_workflow_file(relative):
+    return relative.endswith(WORKFLOW_SUFFIXES)
+
+
+# Analyze the workflow files of one repository. files, when given, limits the analysis to
+# those paths (relative to scan_root); other changed files are ignored.
+def analyze_repo(scan_root, files=None):
+    scan_root = str(scan_root)
+    directory = workflows_dir(scan_root)
+    if files is None:
+        try:
+            paths = [str(path) for path in sorted(directory.iterdir()) if path.is_file()]
+        except OSError:
+            paths = []
+    else:
+        paths = [os.path.join(scan_root, f) for f in files]
+
+    matches = []
+    for path in paths:
+        relative = os.path.relpath(path, scan_root)
+        if not is_workflow_file(relative) or Path(path).parent != directory:
+            continue
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        for line, rule, detail in analyze_workflow(data):
+            matches.append(repo_scanner.Match(scan_root, relative, line, rule, detail))
+    return matches
+
@@ -1,7 +1,16 @@
-import requests
 import json
 import os
+import sys
 import time
+from pathlib import Path
+
+# Shared GitHub client with rate-limit handling lives with the recon scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'recon'))
+from github_client import GitHubClient
+import instrumentation
+
+# HTTP and file write timings, exported at exit when RECON_METRICS / RECON_TRACE / RECON_PROFILE are set
+instrumentation.install_from_env()
 
 # Get the GitHub Personal Access Token from environment variable
 gh_pat = os.getenv('GH_PAT')
@@ -34,15 +43,12 @@ os.makedirs('./commits_blobs', exist_ok=True)
 # Define the GitHub API URL for fetching forks
 url = f'https://api.github.com/repos/{owner}/{repo}/forks'
 
-# Set up the headers with the required authentication and API version
-headers = {
-    'Accept': 'application/vnd.github+json',
-    'Authorization': f'Bearer {gh_pat}',
-    'X-GitHub-Api-Version': '2022-11-28'
-}
+# Set up a pooled client with the required authentication and API version, it waits out
+# rate limits instead of failing
+github = GitHubClient(gh_pat)
 
 # Make a GET request to the GitHub API to fetch the forks
-response = requests.get(url, headers=headers)
+response = github.get(url)
 
 # Check if the request was successful
 if response.status_code == 200:
@@ -63,14 +69,15 @@ if response.status_code == 200:
         commit_url = f'https://api.github.com/repos/{fork_owner}/{fork_repo}/commits/{sha1}'
         
         # Make a GET request to the GitHub API to fetch the commit details
-        commit_response = requests.get(commit_url, headers=headers)
+        commit_response = github.get(commit_url)
         
         # Check if the request was successful
         if commit_response.status_code == 200:
             commit_data = commit_response.json()
             
             # Write commit data to a file
-            with open(f'./commits_blobs/{fork_owner}_{fork_repo}_{sha1}_commit.json', 'w') as f:
+            with instrumentation.span('file_write', target='commit_json'), \
+                    open(f'./commits_blobs/{fork_owner}_{fork_repo}_{sha1}_commit.json', 'w') as f:
                 json.dump(commit_data, f, indent=2)
             
             # Print success message to stdout
@@ -1,7 +1,15 @@
+import sys
+from pathlib import Path
+
 import requests
+
+# Shared instrumentation lives with the recon scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'recon'))
+import instrumentation
+
 def check_hsts(host):
     try:
-        response = requests.get(f'https://{host}', timeout=5)
+        response = instrumentation.request(requests, 'GET', f'https://{host}', timeout=5)
         hsts_header = response.headers.get('Strict-Transport-Security', None)
 
         if hsts_header:
@@ -13,6 +21,9 @@ def check_hsts(host):
         print(f'Connection error for {host}')
 
 def main():
+    # Request timings per host, exported at exit when RECON_METRICS / RECON_TRACE / RECON_PROFILE are set
+    instrumentation.install_from_env()
+
     file_path = 'host_list.txt'  # Change this to the path of your file
     with open(file_path, 'r') as file:
         hosts = file.read().splitlines()
@@ -1,7 +1,13 @@
+import sys
 import time
+from pathlib import Path
 from zapv2 import ZAPv2
 from datetime import datetime
 
+# Shared instrumentation lives with the recon scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "recon"))
+import instrumentation
+
 # --- Configuration ---
 # ZAP Connection Details
 ZAP_ADDRESS = "http://localhost"  # Or your ZAP's IP/hostname
@@ -17,6 +23,9 @@ CONTEXT_NAME_PREFIX = "AutoContext_"
 
 
 def main():
+    # Spider timings and ZAP API polls, exported at exit when RECON_METRICS / RECON_TRACE / RECON_PROFILE are set
+    instrumentation.install_from_env()
+
     zap_proxy = {
         "http": f"{ZAP_ADDRESS}:{ZAP_PORT}",
         "https": f"{ZAP_ADDRESS}:{ZAP_PORT}",
@@ -65,28 +74,29 @@ def main():
     print(
         f"\n--- Starting Traditional Spider for {TARGET_URL} in context '{context_name}' ---"
     )
-    spider_start_time = time.time()
     try:
-        # Start the spider
-        # You can add more parameters like maxchildren, recurse (default True), subtreeonly etc.
-        scan_id = zap.spider.scan(url=TARGET_URL, contextname=context_name)
+        with instrumentation.span("zap_spider", spider="traditional") as spider_timing:
+            # Start the spider
+            # You can add more parameters like maxchildren, recurse (default True), subtreeonly etc.
+            scan_id = zap.spider.scan(url=TARGET_URL, contextname=context_name)
+            if scan_id:
+                print(f"Traditional Spider started with Scan ID: {scan_id}")
+                # Poll the spider status until it's 100%
+                while int(zap.spider.status(scan_id)) < 100:
+                    instrumentation.count("zap_status_polls", spider="traditional")
+                    progress = int(zap.spider.status(scan_id))
+                    print(f"Traditional Spider progress: {progress}%")
+                    time.sleep(5)  # Poll every 5 seconds
+
         if not scan_id:
             print("Error: Failed to start Traditional Spider.")
         else:
-            print(f"Traditional Spider started with Scan ID: {scan_id}")
-            # Poll the spider status until it's 100%
-            while int(zap.spider.status(scan_id)) < 100:
-                progress = int(zap.spider.status(scan_id))
-                print(f"Traditional Spider progress: {progress}%")
-                time.sleep(5)  # Poll every 5 seconds
-
-            spider_end_time = time.time()
-            spider_duration = spider_end_time - spider_start_time
             spider_results = zap.spider.results(scan_id)
             num_urls_found_spider = len(spider_results)
+            instrumentation.count("zap_urls_found", num_urls_found_spider, spider="traditional")
 
             metrics["traditional_spider"] = {
-                "duration_seconds": round(spider_duration, 2),
+                "duration_seconds": round(spider_timing.seconds, 2),
                 "urls_found": num_urls_found_spider,
             }
             print(f"Traditional Spider completed.")
@@ -105,29 +115,30 @@ def main():
     print(
         f"\n--- Starting AJAX Spider for {TARGET_URL} in context '{context_name}' ---"
     )
-    ajax_spider_start_time = time.time()
     try:
-        # Start the AJAX spider
-        # You can add parameters like 'inScope' (though contextname handles this), 'subtreeOnly', etc.
-        # maxduration can also be set here if you want to limit the AJAX spider's own runtime.
-        result = zap.ajaxSpider.scan(url=TARGET_URL, contextname=context_name)
+        with instrumentation.span("zap_spider", spider="ajax") as ajax_spider_timing:
+            # Start the AJAX spider
+            # You can add parameters like 'inScope' (though contextname handles this), 'subtreeOnly', etc.
+            # maxduration can also be set here if you want to limit the AJAX spider's own runtime.
+            result = zap.ajaxSpider.scan(url=TARGET_URL, contextname=context_name)
+            if result.lower() == "ok":
+                print(f"AJAX Spider initiated.")
+                # Poll the AJAX spider status until it's 'stopped'
+                # AJAX Spider states: 'running', 'stopped'
+                while zap.ajaxSpider.status == "running":
+                    instrumentation.count("zap_status_polls", spider="ajax")
+                    print(f"AJAX Spider status: running...")
+                    time.sleep(10)  # Poll every 10 seconds
+
         if result.lower() != "ok":
             print(f"Error: Failed to start AJAX Spider (Zap API returned: {result}).")
         else:
-            print(f"AJAX Spider initiated.")
-            # Poll the AJAX spider status until it's 'stopped'
-            # AJAX Spider states: 'running', 'stopped'
-            while zap.ajaxSpider.status == "running":
-                print(f"AJAX Spider status: running...")
-                time.sleep(10)  # Poll every 10 seconds
-
-            ajax_spider_end_time = time.time()
-            ajax_spider_duration = ajax_spider_end_time - ajax_spider_start_time
             # The number_of_results might give a count, or you can check URLs in context
             num_urls_found_ajax = zap.ajaxSpider.number_of_results
+            instrumentation.count("zap_urls_found", int(num_urls_found_ajax), spider="ajax")
 
             metrics["ajax_spider"] = {
-                "duration_seconds": round(ajax_spider_duration, 2),
+                "duration_seconds": round(ajax_spider_timing.seconds, 2),
                 "urls_found": int(num_urls_found_ajax),  # Ensure it's an int
             }
             print(f"AJAX Spider completed.")